@@ -0,0 +1,72 @@
+# alembic/env.py - Entorno de migraciones del sistema de inventario
+from logging.config import fileConfig
+
+from sqlalchemy import create_engine, pool
+
+from alembic import context
+
+# alembic.ini añade app/ al sys.path (prepend_sys_path), igual que al
+# ejecutar la aplicación desde ese directorio
+from models import models
+from models.database import Base, SQLALCHEMY_DATABASE_URL
+
+config = context.config
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+# Índices que las migraciones crean con SQL propio (0002: trigram de
+# PostgreSQL) y que no están en los modelos; sin este filtro
+# --autogenerate propondría borrarlos
+UNMANAGED_INDEXES = {f"ix_ad_users_{column}_trgm" for column in (
+    "username", "display_name", "email", "first_name", "last_name"
+)}
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """Excluir de la comparación de --autogenerate los índices no gestionados"""
+    if type_ == "index" and reflected and name in UNMANAGED_INDEXES:
+        return False
+    return True
+
+
+def get_url() -> str:
+    """URL de la base de datos: DATABASE_URL del .env, o sqlalchemy.url del .ini"""
+    return SQLALCHEMY_DATABASE_URL or config.get_main_option("sqlalchemy.url")
+
+
+def run_migrations_offline() -> None:
+    """Generar el SQL de las migraciones sin conectarse a la base de datos"""
+    context.configure(
+        url=get_url(),
+        target_metadata=target_metadata,
+        include_object=include_object,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    """Aplicar las migraciones sobre una conexión a la base de datos"""
+    connectable = create_engine(get_url(), poolclass=pool.NullPool)
+
+    with connectable.connect() as connection:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            include_object=include_object
+        )
+
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
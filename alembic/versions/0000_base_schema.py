@@ -0,0 +1,116 @@
+"""Esquema base del inventario
+
+Revision ID: 0000
+Revises: 
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0000'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+ITEM_TYPES = [
+    "LAPTOP", "DESKTOP", "PHONE", "PRINTER", "TABLET", "MONITOR", "ROUTER", "SWITCH",
+    "SERVER", "ACCESSORY", "PERIPHERAL", "CAMERA", "STORAGE", "NETWORK", "OTHER"
+]
+
+
+def _existing_tables() -> set:
+    if op.get_context().as_sql:
+        return set()
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def upgrade() -> None:
+    # Las bases creadas antes de las migraciones ya tienen estas tablas
+    # (Base.metadata.create_all en main.py); solo se crean las que falten.
+    # Los índices de las columnas de filtrado se añaden en 0001
+    tables = _existing_tables()
+
+    if "companies" not in tables:
+        op.create_table(
+            "companies",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("name", sa.String()),
+            sa.Column("created_at", sa.DateTime()),
+        )
+        op.create_index("ix_companies_id", "companies", ["id"])
+        op.create_index("ix_companies_name", "companies", ["name"], unique=True)
+
+    if "locations" not in tables:
+        op.create_table(
+            "locations",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("name", sa.String()),
+            sa.Column("address", sa.Text()),
+            sa.Column("company_id", sa.Integer(), sa.ForeignKey("companies.id")),
+        )
+        op.create_index("ix_locations_id", "locations", ["id"])
+
+    if "departments" not in tables:
+        op.create_table(
+            "departments",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("name", sa.String()),
+            sa.Column("company_id", sa.Integer(), sa.ForeignKey("companies.id")),
+        )
+        op.create_index("ix_departments_id", "departments", ["id"])
+
+    if "users" not in tables:
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("email", sa.String()),
+            sa.Column("full_name", sa.String()),
+            sa.Column("department_id", sa.Integer(), sa.ForeignKey("departments.id")),
+            sa.Column("created_at", sa.DateTime()),
+        )
+        op.create_index("ix_users_id", "users", ["id"])
+        op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    if "items" not in tables:
+        op.create_table(
+            "items",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("brand", sa.String()),
+            sa.Column("model", sa.String()),
+            sa.Column("item_type", sa.Enum(*ITEM_TYPES, name="itemtype")),
+            sa.Column("serial_number", sa.String()),
+            sa.Column("purchase_date", sa.Date()),
+            sa.Column("warranty_end_date", sa.Date()),
+            sa.Column("supplier", sa.String()),
+            sa.Column("location_id", sa.Integer(), sa.ForeignKey("locations.id")),
+            sa.Column("created_at", sa.DateTime()),
+        )
+        op.create_index("ix_items_id", "items", ["id"])
+        op.create_index("ix_items_serial_number", "items", ["serial_number"], unique=True)
+
+    if "assignments" not in tables:
+        op.create_table(
+            "assignments",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("item_id", sa.Integer(), sa.ForeignKey("items.id")),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id")),
+            sa.Column("assigned_date", sa.DateTime()),
+            sa.Column("returned_date", sa.DateTime(), nullable=True),
+            sa.Column("notes", sa.Text()),
+        )
+        op.create_index("ix_assignments_id", "assignments", ["id"])
+
+
+def downgrade() -> None:
+    tables = _existing_tables()
+    for table in ("assignments", "items", "users", "departments", "locations", "companies"):
+        if table in tables:
+            op.drop_table(table)
+    if op.get_context().dialect.name == "postgresql":
+        op.execute("DROP TYPE IF EXISTS itemtype")
@@ -0,0 +1,58 @@
+"""Índices para las columnas de filtrado frecuente
+
+Revision ID: 0001
+Revises: 0000
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = '0000'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+OPEN_ASSIGNMENT = sa.text("returned_date IS NULL")
+
+# (nombre, tabla, columnas, opciones)
+INDEXES = [
+    ("ix_locations_company_id", "locations", ["company_id"], {}),
+    ("ix_departments_company_id", "departments", ["company_id"], {}),
+    ("ix_users_department_id", "users", ["department_id"], {}),
+    ("ix_items_location_id", "items", ["location_id"], {}),
+    ("ix_assignments_item_id", "assignments", ["item_id"], {}),
+    ("ix_assignments_user_id", "assignments", ["user_id"], {}),
+    ("ix_assignments_open", "assignments", ["id"],
+     {"postgresql_where": OPEN_ASSIGNMENT, "sqlite_where": OPEN_ASSIGNMENT}),
+    ("ix_assignments_assigned_date_id", "assignments", ["assigned_date", "id"], {}),
+    ("uq_assignments_open_item", "assignments", ["item_id"],
+     {"unique": True, "postgresql_where": OPEN_ASSIGNMENT, "sqlite_where": OPEN_ASSIGNMENT}),
+]
+
+
+def _existing_indexes(table: str) -> set:
+    if op.get_context().as_sql:
+        return set()
+    return {index["name"] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade() -> None:
+    # Las tablas pueden haber sido creadas ya con los índices por
+    # Base.metadata.create_all (main.py); solo se crean los que falten.
+    # Si hay asignaciones abiertas duplicadas para un mismo ítem, el índice
+    # único fallará: deben cerrarse antes de aplicar la migración.
+    for name, table, columns, options in INDEXES:
+        if name not in _existing_indexes(table):
+            op.create_index(name, table, columns, **options)
+
+
+def downgrade() -> None:
+    for name, table, columns, options in reversed(INDEXES):
+        if name in _existing_indexes(table):
+            op.drop_index(name, table_name=table)
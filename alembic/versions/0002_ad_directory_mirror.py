@@ -0,0 +1,102 @@
+"""Tablas de la copia local del directorio de Active Directory
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Columnas en las que busca /users?source=ad (ILIKE '%término%')
+TRGM_COLUMNS = ["username", "display_name", "email", "first_name", "last_name"]
+
+
+def _existing_tables() -> set:
+    if op.get_context().as_sql:
+        return set()
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def _existing_indexes(table: str) -> set:
+    if op.get_context().as_sql or table not in _existing_tables():
+        return set()
+    return {index["name"] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def _create_index(name: str, table: str, columns: list) -> None:
+    if name not in _existing_indexes(table):
+        op.create_index(name, table, columns)
+
+
+def upgrade() -> None:
+    # Base.metadata.create_all (main.py) puede haber creado ya las tablas y
+    # sus índices al arrancar la aplicación; solo se crea lo que falte
+    tables = _existing_tables()
+
+    if "ad_users" not in tables:
+        op.create_table(
+            "ad_users",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("dn", sa.String(), nullable=False, unique=True),
+            sa.Column("username", sa.String()),
+            sa.Column("display_name", sa.String()),
+            sa.Column("first_name", sa.String()),
+            sa.Column("last_name", sa.String()),
+            sa.Column("email", sa.String()),
+            sa.Column("department", sa.String()),
+            sa.Column("title", sa.String()),
+            sa.Column("phone", sa.String()),
+            sa.Column("mobile", sa.String()),
+            sa.Column("office", sa.String()),
+            sa.Column("company", sa.String()),
+            sa.Column("manager", sa.String()),
+            sa.Column("employee_id", sa.String()),
+            sa.Column("created_date", sa.DateTime(), nullable=True),
+            sa.Column("last_logon", sa.DateTime(), nullable=True),
+            sa.Column("usn_changed", sa.BigInteger()),
+            sa.Column("when_changed", sa.DateTime(), nullable=True),
+            sa.Column("synced_at", sa.DateTime()),
+        )
+    _create_index("ix_ad_users_id", "ad_users", ["id"])
+    _create_index("ix_ad_users_username", "ad_users", ["username"])
+    _create_index("ix_ad_users_email", "ad_users", ["email"])
+    _create_index("ix_ad_users_usn_changed", "ad_users", ["usn_changed"])
+
+    if "ad_sync_state" not in tables:
+        op.create_table(
+            "ad_sync_state",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("server_key", sa.String(), nullable=False, unique=True),
+            sa.Column("highest_usn", sa.BigInteger(), nullable=True),
+            sa.Column("last_full_sync", sa.DateTime(), nullable=True),
+            sa.Column("last_sync", sa.DateTime(), nullable=True),
+            sa.Column("users_count", sa.Integer()),
+        )
+    _create_index("ix_ad_sync_state_id", "ad_sync_state", ["id"])
+
+    # Índices trigram para que las búsquedas por subcadena usen índice
+    if op.get_context().dialect.name == "postgresql":
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for column in TRGM_COLUMNS:
+            op.execute(
+                f"CREATE INDEX IF NOT EXISTS ix_ad_users_{column}_trgm ON ad_users "
+                f"USING gin ({column} gin_trgm_ops)"
+            )
+
+
+def downgrade() -> None:
+    tables = _existing_tables()
+    for table in ("ad_sync_state", "ad_users"):
+        if table in tables:
+            op.drop_table(table)
@@ -0,0 +1,37 @@
+"""Controlador de dominio de la marca de agua de la sincronización de AD
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _existing_columns(table: str) -> set:
+    if op.get_context().as_sql:
+        return set()
+    return {column["name"] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade() -> None:
+    # Base.metadata.create_all (main.py) puede haber creado ya la columna.
+    # Con dc_key vacío la siguiente sincronización es completa
+    if "dc_key" not in _existing_columns("ad_sync_state"):
+        op.add_column("ad_sync_state", sa.Column("dc_key", sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    if "dc_key" in _existing_columns("ad_sync_state"):
+        with op.batch_alter_table("ad_sync_state") as batch_op:
+            batch_op.drop_column("dc_key")
@@ -0,0 +1,47 @@
+"""assigned_date obligatorio en las asignaciones
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _is_nullable(table: str, column: str) -> bool:
+    if op.get_context().as_sql:
+        return True
+    columns = sa.inspect(op.get_bind()).get_columns(table)
+    return next(c["nullable"] for c in columns if c["name"] == column)
+
+
+def upgrade() -> None:
+    # El historial pagina por (assigned_date, id): una fila con NULL no
+    # cabe en el cursor ni en la comparación de tuplas. Las filas antiguas
+    # sin fecha toman la de devolución, o la de alta del ítem, o la actual
+    op.execute(
+        "UPDATE assignments SET assigned_date = COALESCE("
+        "returned_date, "
+        "(SELECT items.created_at FROM items WHERE items.id = assignments.item_id), "
+        "CURRENT_TIMESTAMP"
+        ") WHERE assigned_date IS NULL"
+    )
+    if _is_nullable("assignments", "assigned_date"):
+        with op.batch_alter_table("assignments") as batch_op:
+            batch_op.alter_column("assigned_date", existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade() -> None:
+    if not _is_nullable("assignments", "assigned_date"):
+        with op.batch_alter_table("assignments") as batch_op:
+            batch_op.alter_column("assigned_date", existing_type=sa.DateTime(), nullable=True)
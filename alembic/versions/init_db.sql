@@ -0,0 +1,8 @@
+# Las migraciones se ejecutan desde la raíz del repositorio (alembic.ini).
+# La URL de la base de datos se toma de DATABASE_URL (app/.env).
+
+# Aplicar migraciones
+alembic upgrade head
+
+# Crear una nueva migración a partir de los modelos
+alembic revision --autogenerate -m "Descripción del cambio"
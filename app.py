@@ -1,9 +1,20 @@
 from fastapi import FastAPI, HTTPException, Depends, status
-from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from fastapi.security import HTTPBasic, HTTPBasicCredentials, HTTPBearer, HTTPAuthorizationCredentials, OAuth2PasswordRequestForm
+from jose import JWTError, jwt
 from pydantic import BaseModel
-from ldap3 import Server, Connection, ALL, NTLM
+from ldap3 import Server, Connection, ALL, NONE, NTLM
+from ldap3.core.exceptions import LDAPException, LDAPCommunicationError, LDAPSocketOpenError
+from ldap3.utils.conv import escape_filter_chars
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from typing import Optional
+import hashlib
+import hmac
+import queue
 import secrets
+import threading
+import time
 import os
 from dotenv import load_dotenv
 
@@ -15,7 +26,9 @@ app = FastAPI(
     version="1.0.0"
 )
 
-security = HTTPBasic()
+# Basic (compatibilidad) o Bearer con el token de /auth/token
+security = HTTPBasic(auto_error=False)
+bearer_security = HTTPBearer(auto_error=False)
 
 # Configuración de Active Directory (modificar según tu entorno)
 AD_SERVER = os.getenv("ikeaspc.ikeasi.com")
@@ -24,6 +37,26 @@ AD_SEARCH_TREE = os.getenv("AD_USER_SEARCH_BASE")
 AD_USER = os.getenv("AD_BIND_USER")  # Usuario con permisos de lectura
 AD_PASSWORD = os.getenv("AD_BIND_PASSWORD")
 
+# Credenciales verificadas recientemente (0 desactiva la cache)
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", 300))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", 10000))
+AUTH_CACHE_HASH_ITERATIONS = int(os.getenv("AUTH_CACHE_HASH_ITERATIONS", 10000))
+
+# Conexiones de la cuenta de servicio reutilizadas para consultar usuarios
+AD_SERVICE_POOL_SIZE = int(os.getenv("AD_SERVICE_POOL_SIZE", 4))
+AD_CONNECT_TIMEOUT = int(os.getenv("AD_CONNECT_TIMEOUT", 10))
+AD_RECEIVE_TIMEOUT = int(os.getenv("AD_RECEIVE_TIMEOUT", 30))
+
+# Tokens de sesión (JWT firmado). Sin JWT_SECRET_KEY se genera una clave
+# aleatoria: los tokens dejan de valer al reiniciar y no se comparten
+# entre procesos.
+JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY") or secrets.token_urlsafe(32)
+JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+JWT_EXPIRE_MINUTES = int(os.getenv("JWT_EXPIRE_MINUTES", 60))
+
+if not os.getenv("JWT_SECRET_KEY"):
+    print("Warning: JWT_SECRET_KEY not set, using a random per-process key")
+
 class UserInfo(BaseModel):
     username: str
     display_name: Optional[str] = None
@@ -32,26 +65,176 @@ class UserInfo(BaseModel):
     department: Optional[str] = None
     title: Optional[str] = None
 
+class Token(BaseModel):
+    access_token: str
+    token_type: str = "bearer"
+    expires_in: int
+
+class VerifiedCredentialCache:
+    """Credenciales que ya hicieron bind correctamente en los últimos ttl segundos.
+    
+    No se guarda la contraseña: solo un hash PBKDF2 de usuario + contraseña
+    con sal aleatoria por entrada. Una contraseña distinta (p. ej. tras un
+    cambio) no coincide y obliga a volver a hacer bind.
+    """
+    
+    def __init__(self, ttl: int, max_entries: int, iterations: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.iterations = iterations
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+    
+    def _hash(self, username: str, password: str, salt: bytes) -> bytes:
+        secret = f"{username.lower()}\0{password}".encode("utf-8")
+        return hashlib.pbkdf2_hmac("sha256", secret, salt, self.iterations)
+    
+    def is_verified(self, username: str, password: str) -> bool:
+        if self.ttl <= 0:
+            return False
+        
+        with self._lock:
+            entry = self._entries.get(username.lower())
+        if entry is None:
+            return False
+        
+        salt, digest, expires_at = entry
+        if time.monotonic() >= expires_at:
+            self.forget(username)
+            return False
+        
+        return hmac.compare_digest(digest, self._hash(username, password, salt))
+    
+    def remember(self, username: str, password: str):
+        if self.ttl <= 0:
+            return
+        
+        salt = secrets.token_bytes(16)
+        entry = (salt, self._hash(username, password, salt), time.monotonic() + self.ttl)
+        with self._lock:
+            self._entries[username.lower()] = entry
+            self._entries.move_to_end(username.lower())
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def forget(self, username: str):
+        with self._lock:
+            self._entries.pop(username.lower(), None)
+
+class ServiceConnectionPool:
+    """Conexiones ya ligadas con la cuenta de servicio (AD_BIND_USER).
+    
+    Se crean bajo demanda hasta ``size`` y se devuelven al pool tras cada
+    consulta; una conexión que falla se descarta. ``run`` reintenta una vez
+    con un bind nuevo si la conexión reutilizada estaba cortada (el DC
+    cierra las conexiones inactivas).
+    """
+    
+    def __init__(self, size: int):
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = queue.LifoQueue()
+    
+    def _connect(self) -> Connection:
+        return Connection(
+            get_server(),
+            user=AD_USER,
+            password=AD_PASSWORD,
+            receive_timeout=AD_RECEIVE_TIMEOUT,
+            auto_bind=True
+        )
+    
+    @contextmanager
+    def connection(self, fresh: bool = False):
+        if not self._slots.acquire(timeout=AD_CONNECT_TIMEOUT):
+            raise LDAPException("No AD service connection available")
+        
+        conn = None
+        try:
+            conn = None if fresh else self._checkout_idle()
+            if conn is None:
+                conn = self._connect()
+            
+            yield conn
+            self._idle.put(conn)
+        except Exception:
+            if conn is not None:
+                try:
+                    conn.unbind()
+                except Exception:
+                    pass
+            raise
+        finally:
+            self._slots.release()
+    
+    def _checkout_idle(self) -> Optional[Connection]:
+        """Conexión inactiva aún ligada; las cerradas se descartan"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return None
+            if not conn.closed and conn.bound:
+                return conn
+            try:
+                conn.unbind()
+            except Exception:
+                pass
+    
+    def run(self, operation):
+        """Ejecutar ``operation(conn)`` con una conexión del pool"""
+        try:
+            with self.connection() as conn:
+                return operation(conn)
+        except LDAPSocketOpenError:
+            # No se pudo ni abrir el socket: reintentar no ayuda
+            raise
+        except LDAPCommunicationError as e:
+            print(f"AD service connection lost, retrying with a new bind: {e}")
+            with self.connection(fresh=True) as conn:
+                return operation(conn)
+
+_server = None
+
+def get_server() -> Server:
+    """Servidor compartido; la información del DSE se descarga una sola vez"""
+    global _server
+    if _server is None:
+        _server = Server(AD_SERVER, get_info=ALL, connect_timeout=AD_CONNECT_TIMEOUT)
+    return _server
+
+credential_cache = VerifiedCredentialCache(AUTH_CACHE_TTL, AUTH_CACHE_MAX_ENTRIES, AUTH_CACHE_HASH_ITERATIONS)
+service_pool = ServiceConnectionPool(AD_SERVICE_POOL_SIZE)
+
 def authenticate_ad_user(username: str, password: str) -> bool:
     """Autentica un usuario contra Active Directory"""
+    if not username or not password:
+        return False
+    
+    if credential_cache.is_verified(username, password):
+        return True
+    
     try:
         user_dn = f"{username}@{AD_DOMAIN}"
-        server = Server(AD_SERVER, get_info=ALL)
+        # El bind del usuario no necesita esquema ni info del servidor
+        server = Server(AD_SERVER, get_info=NONE, connect_timeout=AD_CONNECT_TIMEOUT)
         conn = Connection(server, user=user_dn, password=password, authentication=NTLM)
         if conn.bind():
             conn.unbind()
+            credential_cache.remember(username, password)
             return True
+        credential_cache.forget(username)
         return False
     except Exception:
         return False
 
 def get_ad_user_info(username: str) -> Optional[UserInfo]:
-    """Obtiene información de un usuario desde Active Directory"""
-    try:
-        server = Server(AD_SERVER, get_info=ALL)
-        conn = Connection(server, user=AD_USER, password=AD_PASSWORD, auto_bind=True)
-        
-        search_filter = f"(sAMAccountName={username})"
+    """Obtiene información de un usuario desde Active Directory.
+    
+    None si el usuario no existe; si AD no está disponible se responde 503
+    (no un 404 falso).
+    """
+    def search(conn: Connection) -> Optional[UserInfo]:
+        search_filter = f"(sAMAccountName={escape_filter_chars(username)})"
         conn.search(AD_SEARCH_TREE, search_filter, attributes=[
             'displayName', 
             'mail', 
@@ -64,7 +247,7 @@ def get_ad_user_info(username: str) -> Optional[UserInfo]:
             return None
             
         entry = conn.entries[0]
-        user_info = UserInfo(
+        return UserInfo(
             username=username,
             display_name=str(entry.displayName) if 'displayName' in entry else None,
             email=str(entry.mail) if 'mail' in entry else None,
@@ -72,26 +255,67 @@ def get_ad_user_info(username: str) -> Optional[UserInfo]:
             department=str(entry.department) if 'department' in entry else None,
             title=str(entry.title) if 'title' in entry else None
         )
-        
-        conn.unbind()
-        return user_info
-    except Exception as e:
+    
+    try:
+        return service_pool.run(search)
+    except LDAPException as e:
         print(f"Error al consultar AD: {str(e)}")
-        return None
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Active Directory no disponible"
+        )
 
-def get_current_username(credentials: HTTPBasicCredentials = Depends(security)) -> str:
-    """Valida las credenciales básicas y devuelve el nombre de usuario"""
-    if not authenticate_ad_user(credentials.username, credentials.password):
+def create_access_token(user_info: UserInfo) -> Token:
+    """Token firmado con los datos del usuario (grupos, departamento...)"""
+    now = datetime.now(timezone.utc)
+    expires_in = JWT_EXPIRE_MINUTES * 60
+    claims = user_info.model_dump(exclude={"username"})
+    claims.update({
+        "sub": user_info.username,
+        "iat": now,
+        "exp": now + timedelta(seconds=expires_in)
+    })
+    return Token(
+        access_token=jwt.encode(claims, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM),
+        expires_in=expires_in
+    )
+
+def decode_access_token(token: str) -> UserInfo:
+    """Validar el token localmente (firma y caducidad), sin consultar AD"""
+    try:
+        claims = jwt.decode(token, JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM])
+    except JWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Credenciales incorrectas",
-            headers={"WWW-Authenticate": "Basic"},
+            detail="Token inválido o caducado",
+            headers={"WWW-Authenticate": "Bearer"},
         )
+    return UserInfo(username=claims["sub"], **{
+        field: claims.get(field) for field in UserInfo.model_fields if field != "username"
+    })
+
+def _unauthorized(detail: str = "Credenciales incorrectas") -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer, Basic"},
+    )
+
+def get_current_username(credentials: Optional[HTTPBasicCredentials] = Depends(security)) -> str:
+    """Valida las credenciales básicas y devuelve el nombre de usuario"""
+    if credentials is None or not authenticate_ad_user(credentials.username, credentials.password):
+        raise _unauthorized()
     return credentials.username
 
-@app.get("/auth/userinfo", response_model=UserInfo)
-async def get_user_info(username: str = Depends(get_current_username)):
-    """Endpoint para obtener información del usuario autenticado"""
+def get_current_user(
+    token: Optional[HTTPAuthorizationCredentials] = Depends(bearer_security),
+    credentials: Optional[HTTPBasicCredentials] = Depends(security)
+) -> UserInfo:
+    """Usuario autenticado: desde el token (sin LDAP) o, si se usa Basic, desde AD"""
+    if token is not None:
+        return decode_access_token(token.credentials)
+    
+    username = get_current_username(credentials)
     user_info = get_ad_user_info(username)
     if not user_info:
         raise HTTPException(
@@ -100,15 +324,35 @@ async def get_user_info(username: str = Depends(get_current_username)):
         )
     return user_info
 
-@app.post("/auth/validate")
-async def validate_credentials(credentials: HTTPBasicCredentials = Depends(security)):
-    """Endpoint para validar credenciales sin retornar información del usuario"""
-    if not authenticate_ad_user(credentials.username, credentials.password):
+@app.post("/auth/token", response_model=Token)
+def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
+    """Autenticar una vez contra AD y emitir un token de sesión"""
+    if not authenticate_ad_user(form_data.username, form_data.password):
+        raise _unauthorized()
+    
+    user_info = get_ad_user_info(form_data.username)
+    if not user_info:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Credenciales incorrectas",
-            headers={"WWW-Authenticate": "Basic"},
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Usuario no encontrado en Active Directory"
         )
+    return create_access_token(user_info)
+
+@app.get("/auth/userinfo", response_model=UserInfo)
+def get_user_info(user_info: UserInfo = Depends(get_current_user)):
+    """Endpoint para obtener información del usuario autenticado"""
+    return user_info
+
+@app.post("/auth/validate")
+def validate_credentials(
+    token: Optional[HTTPAuthorizationCredentials] = Depends(bearer_security),
+    credentials: Optional[HTTPBasicCredentials] = Depends(security)
+):
+    """Endpoint para validar credenciales o token sin retornar información del usuario"""
+    if token is not None:
+        decode_access_token(token.credentials)
+    else:
+        get_current_username(credentials)
     return {"message": "Credenciales válidas"}
 
 if __name__ == "__main__":
@@ -1,14 +1,21 @@
 from fastapi import FastAPI, Request, Depends
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
-from models import models
-from models.database import engine, Base, get_db
-from routers import items, companies, departments, locations, users, assignments
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import crud, models
+from models.database import engine, Base, get_db, get_pool_status
+from routers import items, companies, departments, locations, users, assignments, exports
+import asyncio
+import logging
+import os
 import uvicorn
 
 models.Base.metadata.create_all(bind=engine)
 
+# Segundos entre sincronizaciones de la copia local de AD (0 = desactivado)
+AD_SYNC_INTERVAL = int(os.getenv("AD_SYNC_INTERVAL", 0))
+
 app = FastAPI(title="Sistema de Inventario IT")
 
 app.mount("/static", StaticFiles(directory="../app/static"), name="static")
@@ -21,14 +28,47 @@ app.include_router(departments.router, prefix="/departments", tags=["departments
 app.include_router(locations.router, prefix="/locations", tags=["locations"])
 app.include_router(users.router, prefix="/users", tags=["users"])
 app.include_router(assignments.router, prefix="/assignments", tags=["assignments"])
+app.include_router(exports.router, prefix="/exports", tags=["exports"])
+
+async def _periodic_ad_sync():
+    while True:
+        try:
+            await run_in_threadpool(users.ad_sync.run)
+        except Exception as e:
+            logging.getLogger(__name__).error(f"Periodic AD sync failed: {e}")
+        await asyncio.sleep(AD_SYNC_INTERVAL)
+
+@app.on_event("startup")
+async def start_ad_sync():
+    # La referencia en app.state evita que el recolector elimine la tarea.
+    # Con varios workers cada uno tiene la suya; el advisory lock de
+    # ADDirectorySync hace que solo una sincronice a la vez
+    app.state.ad_sync_task = None
+    if AD_SYNC_INTERVAL > 0 and users.ad_sync:
+        app.state.ad_sync_task = asyncio.create_task(_periodic_ad_sync())
+
+@app.on_event("shutdown")
+async def stop_export_jobs():
+    if exports.export_jobs:
+        exports.export_jobs.close()
+
+@app.on_event("shutdown")
+async def stop_ad_sync():
+    task = getattr(app.state, "ad_sync_task", None)
+    if task:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    if users.ad_service:
+        users.ad_service.close()
 
 @app.get("/")
-async def root(request: Request, db: Session = Depends(get_db)):
-    items_count = db.query(models.Item).count()
-    users_count = db.query(models.User).count()
-    active_assignments = db.query(models.Assignment).filter(
-        models.Assignment.returned_date == None
-    ).count()
+async def root(request: Request, db: AsyncSession = Depends(get_db)):
+    items_count = await crud.count_items(db)
+    users_count = await crud.count_users(db)
+    active_assignments = await crud.count_active_assignments(db)
     
     return templates.TemplateResponse(
         "index.html",
@@ -40,5 +80,10 @@ async def root(request: Request, db: Session = Depends(get_db)):
         }
     )
 
+@app.get("/db-pool-stats")
+async def db_pool_stats():
+    """Estado del pool de conexiones a la base de datos"""
+    return get_pool_status()
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
@@ -1,89 +1,256 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select, func, or_, tuple_, exists
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
 from . import models, schemas
-from typing import List, Optional
+from typing import Optional, Tuple
+from datetime import datetime
+
+# Las vistas de listado acceden a relaciones en cada fila de la plantilla
+# (item.location.name, assignment.user.full_name...). Se cargan de forma
+# explícita aquí para que cada página haga un número fijo de consultas
+# (con AsyncSession una carga perezosa desde la plantilla fallaría).
+#
+# Los listados usan paginación por cursor (keyset): en lugar de
+# offset(skip) se filtra por la última clave vista, de modo que la página N
+# cuesta lo mismo que la primera. Con limit=None se devuelven todas las filas.
+
+async def _add(db: AsyncSession, instance):
+    db.add(instance)
+    await db.commit()
+    await db.refresh(instance)
+    return instance
+
+async def _count(db: AsyncSession, model, *criteria) -> int:
+    return await db.scalar(select(func.count()).select_from(model).where(*criteria))
 
 # Company CRUD
-def get_company(db: Session, company_id: int):
-    return db.query(models.Company).filter(models.Company.id == company_id).first()
+async def get_company(db: AsyncSession, company_id: int):
+    return await db.get(models.Company, company_id)
 
-def get_companies(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Company).offset(skip).limit(limit).all()
+async def get_companies(db: AsyncSession, cursor: Optional[int] = None, limit: Optional[int] = 100):
+    query = select(models.Company).order_by(models.Company.id)
+    if cursor is not None:
+        query = query.where(models.Company.id > cursor)
+    return (await db.scalars(query.limit(limit))).all()
 
-def create_company(db: Session, company: schemas.CompanyCreate):
-    db_company = models.Company(**company.dict())
-    db.add(db_company)
-    db.commit()
-    db.refresh(db_company)
-    return db_company
+async def create_company(db: AsyncSession, company: schemas.CompanyCreate):
+    return await _add(db, models.Company(**company.dict()))
 
 # Location CRUD
-def create_location(db: Session, location: schemas.LocationCreate):
-    db_location = models.Location(**location.dict())
-    db.add(db_location)
-    db.commit()
-    db.refresh(db_location)
-    return db_location
+async def create_location(db: AsyncSession, location: schemas.LocationCreate):
+    return await _add(db, models.Location(**location.dict()))
+
+async def get_location(db: AsyncSession, location_id: int):
+    return await db.get(models.Location, location_id)
+
+async def get_locations(db: AsyncSession):
+    query = select(models.Location).options(
+        joinedload(models.Location.company)
+    )
+    return (await db.scalars(query)).all()
+
+async def get_locations_by_company(db: AsyncSession, company_id: int):
+    query = select(models.Location).where(models.Location.company_id == company_id)
+    return (await db.scalars(query)).all()
 
-def get_locations_by_company(db: Session, company_id: int):
-    return db.query(models.Location).filter(models.Location.company_id == company_id).all()
+async def count_items_in_location(db: AsyncSession, location_id: int) -> int:
+    return await _count(db, models.Item, models.Item.location_id == location_id)
 
 # Department CRUD
-def create_department(db: Session, department: schemas.DepartmentCreate):
-    db_department = models.Department(**department.dict())
-    db.add(db_department)
-    db.commit()
-    db.refresh(db_department)
-    return db_department
+async def create_department(db: AsyncSession, department: schemas.DepartmentCreate):
+    return await _add(db, models.Department(**department.dict()))
 
-def get_departments_by_company(db: Session, company_id: int):
-    return db.query(models.Department).filter(models.Department.company_id == company_id).all()
+async def get_department(db: AsyncSession, department_id: int):
+    return await db.get(models.Department, department_id)
+
+async def get_departments(db: AsyncSession):
+    query = select(models.Department).options(
+        joinedload(models.Department.company)
+    )
+    return (await db.scalars(query)).all()
+
+async def get_departments_by_company(db: AsyncSession, company_id: int):
+    query = select(models.Department).where(models.Department.company_id == company_id)
+    return (await db.scalars(query)).all()
+
+async def count_users_in_department(db: AsyncSession, department_id: int) -> int:
+    return await _count(db, models.User, models.User.department_id == department_id)
 
 # User CRUD
-def create_user(db: Session, user: schemas.UserCreate):
-    db_user = models.User(**user.dict())
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return db_user
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
+    return await _add(db, models.User(**user.dict()))
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.User).offset(skip).limit(limit).all()
+async def get_users(
+    db: AsyncSession,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = 100,
+    search: Optional[str] = None
+):
+    query = select(models.User).options(
+        joinedload(models.User.department).joinedload(models.Department.company)
+    ).order_by(models.User.id)
+    if search:
+        pattern = f"%{search}%"
+        query = query.where(or_(
+            models.User.full_name.ilike(pattern),
+            models.User.email.ilike(pattern)
+        ))
+    if cursor is not None:
+        query = query.where(models.User.id > cursor)
+    return (await db.scalars(query.limit(limit))).all()
 
-def get_user(db: Session, user_id: int):
-    return db.query(models.User).filter(models.User.id == user_id).first()
+async def get_user(db: AsyncSession, user_id: int):
+    query = select(models.User).options(
+        joinedload(models.User.department)
+    ).where(models.User.id == user_id)
+    return (await db.scalars(query)).first()
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    query = select(models.User).where(models.User.email == email)
+    return (await db.scalars(query)).first()
+
+async def count_users(db: AsyncSession) -> int:
+    return await _count(db, models.User)
 
 # Item CRUD
-def create_item(db: Session, item: schemas.ItemCreate):
-    db_item = models.Item(**item.dict())
-    db.add(db_item)
-    db.commit()
-    db.refresh(db_item)
-    return db_item
+async def create_item(db: AsyncSession, item: schemas.ItemCreate):
+    return await _add(db, models.Item(**item.dict()))
+
+async def get_items(db: AsyncSession, cursor: Optional[int] = None, limit: Optional[int] = 100):
+    query = select(models.Item).options(
+        joinedload(models.Item.location)
+    ).order_by(models.Item.id)
+    if cursor is not None:
+        query = query.where(models.Item.id > cursor)
+    return (await db.scalars(query.limit(limit))).all()
 
-def get_items(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Item).offset(skip).limit(limit).all()
+async def get_item(db: AsyncSession, item_id: int):
+    query = select(models.Item).options(
+        joinedload(models.Item.location).joinedload(models.Location.company),
+        selectinload(models.Item.assignments).joinedload(models.Assignment.user)
+    ).where(models.Item.id == item_id)
+    return (await db.scalars(query)).first()
 
-def get_item(db: Session, item_id: int):
-    return db.query(models.Item).filter(models.Item.id == item_id).first()
+async def get_available_items(
+    db: AsyncSession,
+    location_id: Optional[int] = None,
+    item_type: Optional[models.ItemType] = None,
+    search: Optional[str] = None,
+    limit: Optional[int] = 50
+):
+    """Ítems sin asignación abierta, resuelto en SQL con NOT EXISTS (anti-join)"""
+    open_assignment = exists().where(
+        models.Assignment.item_id == models.Item.id,
+        models.Assignment.returned_date == None
+    )
+    query = select(models.Item).options(
+        joinedload(models.Item.location)
+    ).where(~open_assignment)
+    if location_id is not None:
+        query = query.where(models.Item.location_id == location_id)
+    if item_type is not None:
+        query = query.where(models.Item.item_type == item_type)
+    if search:
+        pattern = f"%{search}%"
+        query = query.where(or_(
+            models.Item.brand.ilike(pattern),
+            models.Item.model.ilike(pattern),
+            models.Item.serial_number.ilike(pattern)
+        ))
+    return (await db.scalars(query.order_by(models.Item.id).limit(limit))).all()
 
-def get_items_by_location(db: Session, location_id: int):
-    return db.query(models.Item).filter(models.Item.location_id == location_id).all()
+async def get_items_by_location(db: AsyncSession, location_id: int):
+    query = select(models.Item).where(models.Item.location_id == location_id)
+    return (await db.scalars(query)).all()
+
+async def count_items(db: AsyncSession) -> int:
+    return await _count(db, models.Item)
 
 # Assignment CRUD
-def create_assignment(db: Session, assignment: schemas.AssignmentCreate):
-    db_assignment = models.Assignment(**assignment.dict())
-    db.add(db_assignment)
-    db.commit()
-    db.refresh(db_assignment)
-    return db_assignment
-
-def get_active_assignments(db: Session):
-    return db.query(models.Assignment).filter(models.Assignment.returned_date == None).all()
-
-def return_item(db: Session, assignment_id: int):
-    assignment = db.query(models.Assignment).filter(models.Assignment.id == assignment_id).first()
+async def create_assignment(db: AsyncSession, assignment: schemas.AssignmentCreate):
+    return await _add(db, models.Assignment(**assignment.dict()))
+
+async def get_assignment(db: AsyncSession, assignment_id: int):
+    query = select(models.Assignment).options(
+        joinedload(models.Assignment.item),
+        joinedload(models.Assignment.user)
+    ).where(models.Assignment.id == assignment_id)
+    return (await db.scalars(query)).first()
+
+async def get_open_assignment_for_item(db: AsyncSession, item_id: int):
+    query = select(models.Assignment).where(
+        models.Assignment.item_id == item_id,
+        models.Assignment.returned_date == None
+    )
+    return (await db.scalars(query)).first()
+
+async def get_active_assignments(db: AsyncSession, cursor: Optional[int] = None, limit: Optional[int] = 100):
+    query = select(models.Assignment).options(
+        joinedload(models.Assignment.item),
+        joinedload(models.Assignment.user)
+    ).where(models.Assignment.returned_date == None).order_by(models.Assignment.id)
+    if cursor is not None:
+        query = query.where(models.Assignment.id > cursor)
+    return (await db.scalars(query.limit(limit))).all()
+
+async def count_active_assignments(db: AsyncSession) -> int:
+    return await _count(db, models.Assignment, models.Assignment.returned_date == None)
+
+def encode_history_cursor(assignment: models.Assignment) -> str:
+    """Cursor del historial: (assigned_date, id) de la última fila vista"""
+    return f"{assignment.assigned_date.isoformat()}_{assignment.id}"
+
+def decode_history_cursor(cursor: str) -> Tuple[datetime, int]:
+    assigned_date, assignment_id = cursor.rsplit("_", 1)
+    return datetime.fromisoformat(assigned_date), int(assignment_id)
+
+async def get_assignment_history(
+    db: AsyncSession,
+    cursor: Optional[Tuple[datetime, int]] = None,
+    limit: Optional[int] = 100
+):
+    query = select(models.Assignment).options(
+        joinedload(models.Assignment.item),
+        joinedload(models.Assignment.user)
+    ).order_by(models.Assignment.assigned_date.desc(), models.Assignment.id.desc())
+    if cursor is not None:
+        query = query.where(
+            tuple_(models.Assignment.assigned_date, models.Assignment.id) < tuple_(*cursor)
+        )
+    return (await db.scalars(query.limit(limit))).all()
+
+async def get_user_assignments(db: AsyncSession, user_id: int, active_only: bool = False):
+    query = select(models.Assignment).options(
+        joinedload(models.Assignment.item)
+    ).where(models.Assignment.user_id == user_id)
+    if active_only:
+        query = query.where(models.Assignment.returned_date == None)
+    return (await db.scalars(query.order_by(models.Assignment.assigned_date.desc()))).all()
+
+async def return_item(db: AsyncSession, assignment_id: int):
+    assignment = await db.get(models.Assignment, assignment_id)
     if assignment:
         assignment.returned_date = datetime.utcnow()
-        db.commit()
-        db.refresh(assignment)
-    return assignment
\ No newline at end of file
+        await db.commit()
+        await db.refresh(assignment)
+    return assignment
+
+# Copia local de Active Directory (ver services/ad_sync.py)
+async def search_directory_users(db: AsyncSession, search: Optional[str] = None, limit: Optional[int] = 200):
+    query = select(models.DirectoryUser).order_by(models.DirectoryUser.username)
+    if search:
+        pattern = f"%{search}%"
+        query = query.where(or_(
+            models.DirectoryUser.username.ilike(pattern),
+            models.DirectoryUser.display_name.ilike(pattern),
+            models.DirectoryUser.first_name.ilike(pattern),
+            models.DirectoryUser.last_name.ilike(pattern),
+            models.DirectoryUser.email.ilike(pattern)
+        ))
+    return (await db.scalars(query.limit(limit))).all()
+
+async def get_directory_sync_state(db: AsyncSession, server_key: str):
+    query = select(models.DirectorySyncState).where(
+        models.DirectorySyncState.server_key == server_key
+    )
+    return (await db.scalars(query)).first()
@@ -1,21 +1,208 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from typing import Dict
 import os
+import threading
+import time
+import uuid
 from dotenv import load_dotenv
 
 load_dotenv()
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# Pool de conexiones (ajustable por despliegue). pre-ping y recycle evitan
+# usar conexiones que PostgreSQL/PgBouncer ya cerró por inactividad.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower().strip() == "true"
+# Milisegundos; 0 deja el statement_timeout del servidor
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 0))
+# PgBouncer en modo transacción: cada transacción puede ir por una conexión
+# de servidor distinta, así que no hay estado de sesión (SET, sentencias
+# preparadas con nombre) que sobreviva entre transacciones
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower().strip() == "true"
+
+# Driver asíncrono equivalente para cada driver síncrono soportado
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def get_async_database_url(url: str) -> str:
+    """Derivar la URL asíncrona a partir de DATABASE_URL (o usar ASYNC_DATABASE_URL)"""
+    async_url = os.getenv("ASYNC_DATABASE_URL")
+    if async_url:
+        return async_url
+
+    parsed_url = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed_url.drivername, parsed_url.drivername)
+    return parsed_url.set(drivername=driver).render_as_string(hide_password=False)
+
+def get_engine_options(url: str) -> Dict:
+    """Opciones de pool y timeouts para create_engine/create_async_engine"""
+    if make_url(url).get_backend_name() != "postgresql":
+        return {}
+
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+    if DB_PGBOUNCER and make_url(url).get_driver_name() == "asyncpg":
+        # Sin cache de sentencias preparadas (la de asyncpg y la del
+        # adaptador de SQLAlchemy) y con nombres únicos para las que se
+        # preparan, que no deben chocar con las de otro cliente
+        options["connect_args"] = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": _prepared_statement_name,
+        }
+
+    return options
+
+def _prepared_statement_name() -> str:
+    return f"__asyncpg_{uuid.uuid4()}__"
+
+# Motor síncrono: create_all, migraciones y scripts fuera de las peticiones
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    **get_engine_options(SQLALCHEMY_DATABASE_URL)
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Motor asíncrono: usado por los routers para no bloquear el event loop
+ASYNC_DATABASE_URL = get_async_database_url(SQLALCHEMY_DATABASE_URL)
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    **get_engine_options(ASYNC_DATABASE_URL)
+)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+class ConnectionAcquireStats:
+    """Tiempo para obtener la conexión de cada petición.
+    
+    Incluye la espera en el pool y, si no había una libre, la apertura de
+    la conexión y el handshake; ``new_connections`` cuenta cuántas veces
+    hubo que abrir una.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.new_connections = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+            self.last_wait = 0.0
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += seconds
+            self.max_wait = max(self.max_wait, seconds)
+            self.last_wait = seconds
+
+    def record_new_connection(self):
+        with self._lock:
+            self.new_connections += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "new_connections": self.new_connections,
+                "avg_wait_ms": round(self.total_wait / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+                "last_wait_ms": round(self.last_wait * 1000, 3)
+            }
+
+acquire_stats = ConnectionAcquireStats()
+
+def _on_connect(dbapi_connection, connection_record):
+    """Ajustes de sesión de cada conexión nueva.
+    
+    statement_timeout se fija con SET y no como parámetro de arranque:
+    PgBouncer rechaza los parámetros de arranque que no conoce. Solo vale
+    con PostgreSQL directo o PgBouncer en modo sesión (ver _on_begin).
+    """
+    # En autocommit para que el SET no se deshaga con el rollback que hace
+    # el pool al devolver la conexión
+    autocommit = dbapi_connection.autocommit
+    dbapi_connection.autocommit = True
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"SET statement_timeout = {DB_STATEMENT_TIMEOUT_MS}")
+    cursor.close()
+    dbapi_connection.autocommit = autocommit
+
+def _on_begin(session, transaction, connection):
+    """statement_timeout de cada transacción con DB_PGBOUNCER.
+    
+    Un SET de sesión quedaría en la conexión de servidor que PgBouncer pasa
+    después a otros clientes; SET LOCAL termina con la transacción. Solo
+    se aplica a las sesiones del ORM (SessionLocal, AsyncSessionLocal).
+    """
+    if connection.dialect.name == "postgresql":
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {DB_STATEMENT_TIMEOUT_MS}")
+
+if DB_STATEMENT_TIMEOUT_MS > 0:
+    if DB_PGBOUNCER:
+        event.listen(Session, "after_begin", _on_begin)
+    else:
+        for _engine in (engine, async_engine.sync_engine):
+            if _engine.dialect.name == "postgresql":
+                event.listen(_engine, "connect", _on_connect)
+event.listen(async_engine.sync_engine, "connect", lambda *args: acquire_stats.record_new_connection())
+
+def get_pool_status() -> Dict:
+    """Estado del pool del motor asíncrono para planificación de capacidad"""
+    pool = async_engine.pool
+    status = {
+        "pool_class": type(pool).__name__,
+        "pre_ping": DB_POOL_PRE_PING,
+        "recycle_seconds": DB_POOL_RECYCLE,
+        "statement_timeout_ms": DB_STATEMENT_TIMEOUT_MS,
+        "pgbouncer": DB_PGBOUNCER,
+        "acquire": acquire_stats.snapshot()
+    }
+
+    # Solo los pools con cola (QueuePool) exponen contadores
+    if hasattr(pool, "checkedout"):
+        status.update({
+            "size": pool.size(),
+            "max_overflow": DB_MAX_OVERFLOW,
+            "timeout_seconds": pool.timeout(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow()
+        })
+
+    return status
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        # Obtener la conexión al inicio para medir cuánto cuesta (espera en
+        # el pool más conexión nueva si no había una libre)
+        started = time.perf_counter()
+        await db.connection()
+        acquire_stats.record(time.perf_counter() - started)
         yield db
-    finally:
-        db.close()
\ No newline at end of file
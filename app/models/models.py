@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, Text, Date
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, Enum, Text, Date, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -37,7 +37,7 @@ class Location(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
     address = Column(Text)
-    company_id = Column(Integer, ForeignKey("companies.id"))
+    company_id = Column(Integer, ForeignKey("companies.id"), index=True)
     
     company = relationship("Company", back_populates="locations")
     items = relationship("Item", back_populates="location")
@@ -47,7 +47,7 @@ class Department(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
-    company_id = Column(Integer, ForeignKey("companies.id"))
+    company_id = Column(Integer, ForeignKey("companies.id"), index=True)
     
     company = relationship("Company", back_populates="departments")
     users = relationship("User", back_populates="department")
@@ -58,7 +58,7 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True)
     full_name = Column(String)
-    department_id = Column(Integer, ForeignKey("departments.id"))
+    department_id = Column(Integer, ForeignKey("departments.id"), index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     department = relationship("Department", back_populates="users")
@@ -75,7 +75,7 @@ class Item(Base):
     purchase_date = Column(Date)
     warranty_end_date = Column(Date)
     supplier = Column(String)
-    location_id = Column(Integer, ForeignKey("locations.id"))
+    location_id = Column(Integer, ForeignKey("locations.id"), index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     location = relationship("Location", back_populates="items")
@@ -85,11 +85,67 @@ class Assignment(Base):
     __tablename__ = "assignments"
     
     id = Column(Integer, primary_key=True, index=True)
-    item_id = Column(Integer, ForeignKey("items.id"))
-    user_id = Column(Integer, ForeignKey("users.id"))
-    assigned_date = Column(DateTime, default=datetime.utcnow)
+    item_id = Column(Integer, ForeignKey("items.id"), index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    assigned_date = Column(DateTime, default=datetime.utcnow, nullable=False)
     returned_date = Column(DateTime, nullable=True)
     notes = Column(Text)
     
+    __table_args__ = (
+        # Un ítem solo puede tener una asignación abierta
+        Index(
+            "uq_assignments_open_item", "item_id",
+            unique=True,
+            postgresql_where=returned_date.is_(None),
+            sqlite_where=returned_date.is_(None)
+        ),
+        # Listado de asignaciones activas (returned_date IS NULL)
+        Index(
+            "ix_assignments_open", "id",
+            postgresql_where=returned_date.is_(None),
+            sqlite_where=returned_date.is_(None)
+        ),
+        # Historial paginado por (assigned_date, id)
+        Index("ix_assignments_assigned_date_id", "assigned_date", "id"),
+    )
+    
     item = relationship("Item", back_populates="assignments")
-    user = relationship("User", back_populates="assignments")
\ No newline at end of file
+    user = relationship("User", back_populates="assignments")
+
+class DirectoryUser(Base):
+    """Copia local de un usuario de Active Directory (ver services/ad_sync.py)"""
+    __tablename__ = "ad_users"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    dn = Column(String, unique=True, nullable=False)
+    username = Column(String, index=True)
+    display_name = Column(String)
+    first_name = Column(String)
+    last_name = Column(String)
+    email = Column(String, index=True)
+    department = Column(String)
+    title = Column(String)
+    phone = Column(String)
+    mobile = Column(String)
+    office = Column(String)
+    company = Column(String)
+    manager = Column(String)
+    employee_id = Column(String)
+    created_date = Column(DateTime, nullable=True)
+    last_logon = Column(DateTime, nullable=True)
+    usn_changed = Column(BigInteger, index=True)
+    when_changed = Column(DateTime, nullable=True)
+    synced_at = Column(DateTime, default=datetime.utcnow)
+
+class DirectorySyncState(Base):
+    """Marca de agua (uSNChanged) de la última sincronización por servidor"""
+    __tablename__ = "ad_sync_state"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    server_key = Column(String, unique=True, nullable=False)
+    # DC que dio la marca de agua (dnsHostName|invocationId del rootDSE)
+    dc_key = Column(String, nullable=True)
+    highest_usn = Column(BigInteger, nullable=True)
+    last_full_sync = Column(DateTime, nullable=True)
+    last_sync = Column(DateTime, nullable=True)
+    users_count = Column(Integer, default=0)
@@ -131,4 +131,25 @@ class UserSearchRequest(BaseModel):
 class ExportRequest(BaseModel):
     format: str  # 'excel', 'csv', 'json'
     search_term: Optional[str] = ""
-    include_groups: Optional[bool] = False
\ No newline at end of file
+    include_groups: Optional[bool] = False
+
+class GroupResolutionRequest(BaseModel):
+    usernames: List[str]
+    nested: Optional[bool] = True
+
+class ADUserBatchRequest(BaseModel):
+    usernames: List[str]
+    chunk_size: Optional[int] = None
+
+class ADUserImportRequest(BaseModel):
+    search_term: Optional[str] = ""
+    company_id: Optional[int] = None
+    create_departments: Optional[bool] = False
+    default_department_id: Optional[int] = None
+
+class ExportJobRequest(BaseModel):
+    source: str = "users"  # 'users', 'ad_users', 'items', 'assignments'
+    format: str = "csv"
+    search_term: Optional[str] = ""
+    include_groups: Optional[bool] = False
+    active_only: Optional[bool] = False
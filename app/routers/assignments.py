@@ -1,69 +1,163 @@
 # app/routers/assignments.py
-from fastapi import APIRouter, Depends, Request, Form, HTTPException
+from fastapi import APIRouter, Depends, Request, Form, HTTPException, Query
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import RedirectResponse, HTMLResponse
-from sqlalchemy.orm import Session
+from fastapi.responses import RedirectResponse, HTMLResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError
+from typing import Optional
 from datetime import datetime
 
 from models import crud, models, schemas
 from models.database import get_db
 
+# Import del servicio de export con manejo de errores
+try:
+    from services.export_service import (
+        ExportService, EXPORT_FORMATS, STREAMING_FORMATS, COLUMNAR_FORMATS, ARROW_AVAILABLE
+    )
+    from services import export_sources
+    export_service = ExportService()
+except ImportError as e:
+    print(f"Warning: Could not import ExportService: {e}")
+    export_service = None
+
 router = APIRouter()
 templates = Jinja2Templates(directory="../app/templates")
 
 @router.get("/", response_class=HTMLResponse)
-async def list_assignments(request: Request, db: Session = Depends(get_db)):
-    assignments = crud.get_active_assignments(db)
+async def list_assignments(
+    request: Request,
+    cursor: Optional[int] = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db)
+):
+    assignments = await crud.get_active_assignments(db, cursor=cursor, limit=limit)
+    next_cursor = assignments[-1].id if len(assignments) == limit else None
     return templates.TemplateResponse(
         "assignments/list.html",
-        {"request": request, "assignments": assignments}
+        {"request": request, "assignments": assignments, "next_cursor": next_cursor, "limit": limit}
     )
 
 @router.get("/history", response_class=HTMLResponse)
-async def assignment_history(request: Request, db: Session = Depends(get_db)):
-    # Obtener todas las asignaciones (activas e históricas)
-    all_assignments = db.query(models.Assignment).order_by(
-        models.Assignment.assigned_date.desc()
-    ).all()
+async def assignment_history(
+    request: Request,
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db)
+):
+    # Obtener asignaciones (activas e históricas) página a página
+    try:
+        history_cursor = crud.decode_history_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    all_assignments = await crud.get_assignment_history(db, cursor=history_cursor, limit=limit)
+    next_cursor = None
+    if len(all_assignments) == limit:
+        next_cursor = crud.encode_history_cursor(all_assignments[-1])
     
     return templates.TemplateResponse(
         "assignments/history.html",
-        {"request": request, "assignments": all_assignments}
+        {"request": request, "assignments": all_assignments, "next_cursor": next_cursor, "limit": limit}
     )
 
-@router.get("/create", response_class=HTMLResponse)
-async def create_assignment_form(request: Request, db: Session = Depends(get_db)):
-    # Obtener items no asignados
-    all_items = db.query(models.Item).all()
-    assigned_items = db.query(models.Assignment).filter(
-        models.Assignment.returned_date == None
-    ).all()
-    assigned_item_ids = [a.item_id for a in assigned_items]
+@router.get("/export")
+async def export_assignments(
+    format: str = Query("csv"),
+    active_only: bool = Query(False)
+):
+    """Exportar asignaciones (con datos del ítem y del usuario), leídas por bloques"""
+    if not export_service:
+        raise HTTPException(status_code=503, detail="Export service not available")
+    
+    if format not in STREAMING_FORMATS and format not in COLUMNAR_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format: {format}")
+    
+    media_type, extension = EXPORT_FORMATS[format]
+    filename = f"asignaciones_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    rows = export_sources.iter_assignments(active_only=active_only)
     
-    available_items = [item for item in all_items if item.id not in assigned_item_ids]
-    users = crud.get_users(db)
+    if format in STREAMING_FORMATS:
+        return StreamingResponse(export_service.stream(format, rows), media_type=media_type, headers=headers)
+    
+    # Parquet/Arrow: se escribe por lotes a un fichero temporal fuera del event loop
+    if not ARROW_AVAILABLE:
+        raise HTTPException(status_code=503, detail="pyarrow is not installed")
+    content = await run_in_threadpool(export_service.export_columnar, format, rows, export_sources.ASSIGNMENT_COLUMNS)
+    return StreamingResponse(export_service.iter_file(content), media_type=media_type, headers=headers)
+
+@router.get("/create", response_class=HTMLResponse)
+async def create_assignment_form(request: Request, db: AsyncSession = Depends(get_db)):
+    # Primera página de items no asignados y de usuarios; el resto se busca
+    # con /assignments/api/available-items y /assignments/api/users desde el
+    # formulario
+    available_items = await crud.get_available_items(db)
+    users = await crud.get_users(db, limit=50)
     
     return templates.TemplateResponse(
         "assignments/create.html",
         {
             "request": request,
             "available_items": available_items,
-            "users": users
+            "users": users,
+            "item_types": [t.value for t in models.ItemType]
         }
     )
 
+@router.get("/api/available-items")
+async def search_available_items(
+    q: Optional[str] = Query(None),
+    location_id: Optional[int] = Query(None),
+    item_type: Optional[models.ItemType] = Query(None),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
+):
+    """Búsqueda incremental (typeahead) de items disponibles para asignar"""
+    items = await crud.get_available_items(
+        db, location_id=location_id, item_type=item_type, search=q, limit=limit
+    )
+    return [
+        {
+            "id": item.id,
+            "brand": item.brand,
+            "model": item.model,
+            "serial_number": item.serial_number,
+            "item_type": item.item_type.value if item.item_type else None,
+            "location": item.location.name if item.location else None
+        }
+        for item in items
+    ]
+
+@router.get("/api/users")
+async def search_users(
+    q: Optional[str] = Query(None),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_db)
+):
+    """Búsqueda incremental (typeahead) de usuarios para asignar"""
+    users = await crud.get_users(db, limit=limit, search=q)
+    return [
+        {
+            "id": user.id,
+            "full_name": user.full_name,
+            "department": user.department.name if user.department else None
+        }
+        for user in users
+    ]
+
 @router.post("/create")
 async def create_assignment(
     item_id: int = Form(...),
     user_id: int = Form(...),
     notes: str = Form(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    # Verificar que el item no esté ya asignado
-    existing_assignment = db.query(models.Assignment).filter(
-        models.Assignment.item_id == item_id,
-        models.Assignment.returned_date == None
-    ).first()
+    # Verificar que el item no esté ya asignado (sondeo sobre el índice
+    # parcial uq_assignments_open_item, que además impide la carrera entre
+    # dos peticiones simultáneas)
+    existing_assignment = await crud.get_open_assignment_for_item(db, item_id)
     
     if existing_assignment:
         raise HTTPException(status_code=400, detail="Item is already assigned")
@@ -73,17 +167,19 @@ async def create_assignment(
         user_id=user_id,
         notes=notes
     )
-    crud.create_assignment(db, assignment)
+    try:
+        await crud.create_assignment(db, assignment)
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Item is already assigned")
     return RedirectResponse(url="/assignments", status_code=302)
 
 @router.post("/{assignment_id}/return")
 async def return_assignment(
     assignment_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    assignment = db.query(models.Assignment).filter(
-        models.Assignment.id == assignment_id
-    ).first()
+    assignment = await db.get(models.Assignment, assignment_id)
     
     if not assignment:
         raise HTTPException(status_code=404, detail="Assignment not found")
@@ -92,15 +188,13 @@ async def return_assignment(
         raise HTTPException(status_code=400, detail="Item already returned")
     
     assignment.returned_date = datetime.utcnow()
-    db.commit()
+    await db.commit()
     
     return RedirectResponse(url="/assignments", status_code=302)
 
 @router.get("/{assignment_id}", response_class=HTMLResponse)
-async def view_assignment(request: Request, assignment_id: int, db: Session = Depends(get_db)):
-    assignment = db.query(models.Assignment).filter(
-        models.Assignment.id == assignment_id
-    ).first()
+async def view_assignment(request: Request, assignment_id: int, db: AsyncSession = Depends(get_db)):
+    assignment = await crud.get_assignment(db, assignment_id)
     
     if not assignment:
         raise HTTPException(status_code=404, detail="Assignment not found")
@@ -114,16 +208,14 @@ async def view_assignment(request: Request, assignment_id: int, db: Session = De
 async def update_assignment_notes(
     assignment_id: int,
     notes: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    assignment = db.query(models.Assignment).filter(
-        models.Assignment.id == assignment_id
-    ).first()
+    assignment = await db.get(models.Assignment, assignment_id)
     
     if not assignment:
         raise HTTPException(status_code=404, detail="Assignment not found")
     
     assignment.notes = notes
-    db.commit()
+    await db.commit()
     
     return RedirectResponse(url=f"/assignments/{assignment_id}", status_code=302)
\ No newline at end of file
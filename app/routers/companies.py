@@ -1,9 +1,9 @@
 # app/routers/companies.py
-from fastapi import APIRouter, Depends, Request, Form
+from fastapi import APIRouter, Depends, Request, Form, Query
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import RedirectResponse
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 
 from models import crud, models, schemas
 from models.database import get_db
@@ -12,11 +12,17 @@ router = APIRouter()
 templates = Jinja2Templates(directory="../app/templates")
 
 @router.get("/")
-async def list_companies(request: Request, db: Session = Depends(get_db)):
-    companies = crud.get_companies(db)
+async def list_companies(
+    request: Request,
+    cursor: Optional[int] = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db)
+):
+    companies = await crud.get_companies(db, cursor=cursor, limit=limit)
+    next_cursor = companies[-1].id if len(companies) == limit else None
     return templates.TemplateResponse(
         "companies/list.html",
-        {"request": request, "companies": companies}
+        {"request": request, "companies": companies, "next_cursor": next_cursor, "limit": limit}
     )
 
 @router.get("/create")
@@ -29,9 +35,9 @@ async def create_company_form(request: Request):
 @router.post("/create")
 async def create_company(
     name: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     company = schemas.CompanyCreate(name=name)
-    crud.create_company(db, company)
+    await crud.create_company(db, company)
     return RedirectResponse(url="/companies", status_code=302)
 
@@ -0,0 +1,102 @@
+# app/routers/exports.py - Exportaciones en segundo plano
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from models import schemas
+# El servicio de AD se comparte con el router de usuarios (mismo pool y cache)
+from routers.users import ad_service
+
+# Import de los trabajos de exportación con manejo de errores
+try:
+    from services.export_jobs import ExportJobManager, ExportJob
+    EXPORT_JOBS_AVAILABLE = True
+except ImportError as e:
+    print(f"Warning: Could not import ExportJobManager: {e}")
+    EXPORT_JOBS_AVAILABLE = False
+    ExportJobManager = None
+
+router = APIRouter()
+
+if EXPORT_JOBS_AVAILABLE:
+    try:
+        export_jobs = ExportJobManager(ad_service)
+    except Exception as e:
+        print(f"Warning: Could not initialize export jobs: {e}")
+        export_jobs = None
+else:
+    export_jobs = None
+
+
+def _job_manager() -> "ExportJobManager":
+    if not export_jobs:
+        raise HTTPException(status_code=503, detail="Export jobs not available")
+    return export_jobs
+
+
+def _job_response(job: "ExportJob") -> dict:
+    data = job.to_dict()
+    data["status_url"] = f"/exports/jobs/{job.id}"
+    data["download_url"] = f"/exports/jobs/{job.id}/download" if job.status == ExportJob.DONE else None
+    return data
+
+
+@router.post("/jobs", status_code=202)
+async def create_export_job(request: schemas.ExportJobRequest):
+    """Crear un trabajo de exportación (o reutilizar uno igual en curso o reciente)"""
+    manager = _job_manager()
+    try:
+        job, reused = manager.submit(
+            request.source,
+            request.format,
+            search_term=request.search_term or "",
+            include_groups=bool(request.include_groups),
+            active_only=bool(request.active_only)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    data = _job_response(job)
+    data["reused"] = reused
+    # Un resultado ya generado se devuelve con 200 en lugar de 202
+    return JSONResponse(data, status_code=200 if reused and job.finished else 202)
+
+
+@router.get("/jobs")
+async def list_export_jobs():
+    """Trabajos de exportación en curso y resultados aún disponibles"""
+    return [_job_response(job) for job in _job_manager().list_jobs()]
+
+
+@router.get("/jobs/{job_id}")
+async def get_export_job(job_id: str):
+    """Estado de un trabajo: filas procesadas, progreso y tiempo estimado"""
+    job = _job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Export job not found or expired")
+    return _job_response(job)
+
+
+@router.get("/jobs/{job_id}/download")
+async def download_export_job(job_id: str):
+    """Descargar el fichero de un trabajo terminado"""
+    job = _job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Export job not found or expired")
+    if job.status == ExportJob.FAILED:
+        raise HTTPException(status_code=409, detail=f"Export job failed: {job.error}")
+    if job.status != ExportJob.DONE or not job.path:
+        raise HTTPException(status_code=409, detail=f"Export job is {job.status}")
+
+    # El fichero se abre (y la descarga se registra) antes de responder para
+    # que la purga de caducados no lo borre mientras se envía
+    result = _job_manager().open_result(job_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Export job not found or expired")
+    job, handle = result
+
+    headers = {
+        "Content-Disposition": f'attachment; filename="{job.filename}"',
+        "Content-Length": str(job.size_bytes)
+    }
+    return StreamingResponse(_job_manager().iter_result(job, handle), media_type=job.media_type, headers=headers)
@@ -1,27 +1,45 @@
-from fastapi import APIRouter, Depends, Request, Form
+from fastapi import APIRouter, Depends, Request, Form, HTTPException, Query
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import RedirectResponse
-from sqlalchemy.orm import Session
-from typing import List
-from datetime import date
+from fastapi.responses import RedirectResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from datetime import date, datetime
 
 from models import crud, models, schemas
 from models.database import get_db
 
+# Import del servicio de export con manejo de errores
+try:
+    from services.export_service import (
+        ExportService, EXPORT_FORMATS, STREAMING_FORMATS, COLUMNAR_FORMATS, ARROW_AVAILABLE
+    )
+    from services import export_sources
+    export_service = ExportService()
+except ImportError as e:
+    print(f"Warning: Could not import ExportService: {e}")
+    export_service = None
+
 router = APIRouter()
 templates = Jinja2Templates(directory="../app/templates")
 
 @router.get("/")
-async def list_items(request: Request, db: Session = Depends(get_db)):
-    items = crud.get_items(db)
+async def list_items(
+    request: Request,
+    cursor: Optional[int] = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db)
+):
+    items = await crud.get_items(db, cursor=cursor, limit=limit)
+    next_cursor = items[-1].id if len(items) == limit else None
     return templates.TemplateResponse(
         "items/list.html",
-        {"request": request, "items": items}
+        {"request": request, "items": items, "next_cursor": next_cursor, "limit": limit}
     )
 
 @router.get("/create")
-async def create_item_form(request: Request, db: Session = Depends(get_db)):
-    locations = db.query(models.Location).all()
+async def create_item_form(request: Request, db: AsyncSession = Depends(get_db)):
+    locations = await crud.get_locations(db)
     return templates.TemplateResponse(
         "items/create.html",
         {
@@ -41,7 +59,7 @@ async def create_item(
     warranty_end_date: date = Form(None),
     supplier: str = Form(...),
     location_id: int = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     item = schemas.ItemCreate(
         brand=brand,
@@ -53,12 +71,35 @@ async def create_item(
         supplier=supplier,
         location_id=location_id
     )
-    crud.create_item(db, item)
+    await crud.create_item(db, item)
     return RedirectResponse(url="/items", status_code=302)
 
+@router.get("/export")
+async def export_items(format: str = Query("csv")):
+    """Exportar el inventario completo, leído por bloques"""
+    if not export_service:
+        raise HTTPException(status_code=503, detail="Export service not available")
+    
+    if format not in STREAMING_FORMATS and format not in COLUMNAR_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format: {format}")
+    
+    media_type, extension = EXPORT_FORMATS[format]
+    filename = f"inventario_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    rows = export_sources.iter_items()
+    
+    if format in STREAMING_FORMATS:
+        return StreamingResponse(export_service.stream(format, rows), media_type=media_type, headers=headers)
+    
+    # Parquet/Arrow: se escribe por lotes a un fichero temporal fuera del event loop
+    if not ARROW_AVAILABLE:
+        raise HTTPException(status_code=503, detail="pyarrow is not installed")
+    content = await run_in_threadpool(export_service.export_columnar, format, rows, export_sources.ITEM_COLUMNS)
+    return StreamingResponse(export_service.iter_file(content), media_type=media_type, headers=headers)
+
 @router.get("/{item_id}")
-async def view_item(request: Request, item_id: int, db: Session = Depends(get_db)):
-    item = crud.get_item(db, item_id)
+async def view_item(request: Request, item_id: int, db: AsyncSession = Depends(get_db)):
+    item = await crud.get_item(db, item_id)
     return templates.TemplateResponse(
         "items/detail.html",
         {"request": request, "item": item}
@@ -3,27 +3,43 @@
 from fastapi import APIRouter, Depends, Request, Form, HTTPException, Query
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import RedirectResponse, HTMLResponse, StreamingResponse
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
-import io
 from datetime import datetime
 
 # Imports del proyecto
-from models import crud, models, schemas
+from models import crud, schemas
 from models.database import get_db
 
 # Import del servicio AD con manejo de errores
 try:
-    from services.ad_service import ActiveDirectoryService
+    from services.ad_service import ActiveDirectoryService, ADTimeoutError, CircuitOpenError
     AD_AVAILABLE = True
 except ImportError as e:
     print(f"Warning: Could not import ActiveDirectoryService: {e}")
     AD_AVAILABLE = False
     ActiveDirectoryService = None
+    ADTimeoutError = TimeoutError
+    CircuitOpenError = ConnectionError
+
+# Import de la sincronización con la copia local de AD
+try:
+    from services.ad_sync import ADDirectorySync
+    from services.user_import import ADUserImporter
+    AD_SYNC_AVAILABLE = True
+except ImportError as e:
+    print(f"Warning: Could not import ADDirectorySync: {e}")
+    AD_SYNC_AVAILABLE = False
+    ADDirectorySync = None
+    ADUserImporter = None
 
 # Import del servicio de export con manejo de errores  
 try:
-    from services.export_service import ExportService
+    from services.export_service import (
+        ExportService, EXPORT_FORMATS, STREAMING_FORMATS, ARROW_AVAILABLE
+    )
+    from services import export_sources
     EXPORT_AVAILABLE = True
 except ImportError as e:
     print(f"Warning: Could not import ExportService: {e}")
@@ -44,6 +60,9 @@ if AD_AVAILABLE:
 else:
     ad_service = None
 
+ad_sync = ADDirectorySync(ad_service) if AD_AVAILABLE and AD_SYNC_AVAILABLE else None
+user_importer = ADUserImporter(ad_service) if AD_AVAILABLE and AD_SYNC_AVAILABLE else None
+
 if EXPORT_AVAILABLE:
     try:
         export_service = ExportService()
@@ -59,7 +78,10 @@ async def list_users(
     request: Request, 
     search: Optional[str] = Query(None),
     source: Optional[str] = Query("local"),
-    db: Session = Depends(get_db)
+    cursor: Optional[int] = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    ad_limit: int = Query(200, ge=1, le=5000),
+    db: AsyncSession = Depends(get_db)
 ):
     """Lista usuarios desde base local o Active Directory"""
     
@@ -106,19 +128,35 @@ async def list_users(
                 }
             )
         
-        # Buscar en Active Directory
         search_term = search if search else ""
         try:
-            ad_users = ad_service.search_users(search_term, max_results=200)
+            # Primero la copia local sincronizada; AD solo si nunca se ha
+            # sincronizado o la copia no tiene resultados
+            ad_users = []
+            mirror_state = None
+            if ad_sync:
+                mirror_state = await crud.get_directory_sync_state(db, ad_sync.server_key)
+                if mirror_state and mirror_state.last_sync:
+                    ad_users = list(await crud.search_directory_users(db, search_term, limit=ad_limit + 1))
+            
+            if not ad_users:
+                mirror_state = None
+                # Búsqueda paginada (con cache de resultados), como máximo
+                # limit + 1 resultados para saber si hay más
+                ad_users = await ad_service.search_users_async(search_term, max_results=ad_limit + 1)
+            truncated = len(ad_users) > ad_limit
             
             return templates.TemplateResponse(
                 "users/list_ad.html",
                 {
                     "request": request, 
-                    "users": ad_users,
+                    "users": ad_users[:ad_limit],
                     "search_term": search_term,
                     "source": "ad",
-                    "config_status": config_status
+                    "config_status": config_status,
+                    "truncated": truncated,
+                    "ad_limit": ad_limit,
+                    "mirror_state": mirror_state
                 }
             )
         except Exception as e:
@@ -135,9 +173,8 @@ async def list_users(
             )
     else:
         # Buscar en base local (comportamiento original)
-        users = crud.get_users(db)
-        if search:
-            users = [u for u in users if search.lower() in u.full_name.lower() or search.lower() in u.email.lower()]
+        users = await crud.get_users(db, cursor=cursor, limit=limit, search=search)
+        next_cursor = users[-1].id if len(users) == limit else None
         
         return templates.TemplateResponse(
             "users/list.html",
@@ -145,7 +182,9 @@ async def list_users(
                 "request": request, 
                 "users": users,
                 "search_term": search,
-                "source": "local"
+                "source": "local",
+                "next_cursor": next_cursor,
+                "limit": limit
             }
         )
 
@@ -160,8 +199,14 @@ async def test_ad_connection():
         }
     
     try:
-        result = ad_service.test_connection()
+        result = await ad_service.test_connection_async()
         return result
+    except ADTimeoutError as e:
+        return {
+            "success": False,
+            "error": str(e),
+            "details": "The domain controller did not answer in time"
+        }
     except Exception as e:
         return {
             "success": False,
@@ -186,6 +231,55 @@ async def get_ad_config_status():
             "error": str(e)
         }
 
+@router.post("/ad-sync")
+async def sync_ad_directory(full: bool = Query(False)):
+    """Sincronizar la copia local de AD (incremental salvo full=true)"""
+    if not ad_sync:
+        raise HTTPException(status_code=503, detail="Active Directory service not available")
+    
+    try:
+        return await run_in_threadpool(ad_sync.run, full)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error syncing AD directory: {str(e)}")
+
+@router.post("/import-ad")
+async def import_ad_users(request: schemas.ADUserImportRequest):
+    """Alta/actualización masiva de usuarios locales a partir de AD"""
+    if not user_importer:
+        raise HTTPException(status_code=503, detail="Active Directory service not available")
+    
+    try:
+        return await run_in_threadpool(
+            user_importer.run,
+            request.search_term or "",
+            request.company_id,
+            request.create_departments,
+            request.default_department_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error importing AD users: {str(e)}")
+
+@router.get("/ad-cache-stats")
+async def get_ad_cache_stats():
+    """Contadores de la cache de resultados de AD"""
+    if not AD_AVAILABLE or not ad_service:
+        raise HTTPException(status_code=503, detail="Active Directory service not available")
+    
+    return ad_service.cache_stats()
+
+@router.post("/ad-cache/invalidate")
+async def invalidate_ad_cache(username: Optional[str] = Query(None)):
+    """Vaciar la cache de resultados de AD (toda o la de un usuario)"""
+    if not AD_AVAILABLE or not ad_service:
+        raise HTTPException(status_code=503, detail="Active Directory service not available")
+    
+    removed = ad_service.invalidate_cache(username)
+    return {"success": True, "removed": removed, "stats": ad_service.cache_stats()}
+
 @router.get("/ad-debug", response_class=HTMLResponse)
 async def ad_debug_page(request: Request):
     """Página de diagnóstico de Active Directory"""
@@ -196,7 +290,7 @@ async def ad_debug_page(request: Request):
     else:
         try:
             config_status = ad_service.get_config_status()
-            connection_test = ad_service.test_connection()
+            connection_test = await ad_service.test_connection_async()
         except Exception as e:
             config_status = {"status": "error", "error": str(e)}
             connection_test = {"success": False, "error": str(e)}
@@ -219,25 +313,163 @@ async def view_ad_user(request: Request, username: str):
         raise HTTPException(status_code=503, detail="Active Directory service not available")
     
     try:
-        user = ad_service.get_user_by_username(username)
+        user = await ad_service.get_user_by_username_async(username)
         
         if not user:
             raise HTTPException(status_code=404, detail="Usuario no encontrado en Active Directory")
         
-        # Obtener grupos del usuario
-        user['groups'] = ad_service.get_user_groups(username)
+        # Los grupos llegan en la misma consulta (memberOf); solo si el
+        # atributo no está disponible se piden aparte
+        if 'groups' not in user:
+            user['groups'] = await ad_service.get_user_groups_async(username)
         
         return templates.TemplateResponse(
             "users/ad_detail.html",
             {"request": request, "user": user}
         )
+    except HTTPException:
+        raise
+    except ADTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error accessing AD user: {str(e)}")
 
+@router.post("/ad-users/batch")
+async def get_ad_users_batch(request: schemas.ADUserBatchRequest):
+    """Datos y grupos de varios usuarios de AD en una sola llamada"""
+    if not AD_AVAILABLE or not ad_service:
+        raise HTTPException(status_code=503, detail="Active Directory service not available")
+    
+    if request.chunk_size is not None and not 1 <= request.chunk_size <= ad_service.page_size:
+        raise HTTPException(
+            status_code=400,
+            detail=f"chunk_size must be between 1 and the AD page size ({ad_service.page_size})"
+        )
+    
+    try:
+        results = await ad_service.get_users_by_usernames_async(request.usernames, request.chunk_size)
+    except ADTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error looking up AD users: {str(e)}")
+    
+    return {
+        "users": {username: user for username, user in results.items() if user is not None},
+        "not_found": [username for username, user in results.items() if user is None]
+    }
+
+@router.get("/ad-user/{username}/groups")
+async def get_ad_user_groups(username: str, nested: bool = Query(True)):
+    """Grupos de un usuario de AD (directos o incluyendo los anidados)"""
+    if not AD_AVAILABLE or not ad_service:
+        raise HTTPException(status_code=503, detail="Active Directory service not available")
+    
+    try:
+        groups = (await ad_service.resolve_groups_async([username], nested=nested)).get(username.strip())
+    except ADTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error resolving AD groups: {str(e)}")
+    
+    if groups is None:
+        raise HTTPException(status_code=404, detail="Usuario no encontrado en Active Directory")
+    
+    return {"username": username, "nested": nested, "groups": groups}
+
+@router.post("/ad-groups/resolve")
+async def resolve_ad_groups(request: schemas.GroupResolutionRequest):
+    """Grupos (incluidos los anidados) de varios usuarios de AD"""
+    if not AD_AVAILABLE or not ad_service:
+        raise HTTPException(status_code=503, detail="Active Directory service not available")
+    
+    try:
+        results = await ad_service.resolve_groups_async(request.usernames, nested=request.nested)
+    except ADTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error resolving AD groups: {str(e)}")
+    
+    return {
+        "nested": request.nested,
+        "groups": {username: groups for username, groups in results.items() if groups is not None},
+        "not_found": [username for username, groups in results.items() if groups is None]
+    }
+
+@router.get("/export", response_class=HTMLResponse)
+async def export_users_form(request: Request):
+    """Formulario de exportación de usuarios"""
+    return templates.TemplateResponse(
+        "users/export.html",
+        {"request": request}
+    )
+
+@router.post("/export")
+async def export_users(
+    source: str = Form("local"),
+    format: str = Form("excel"),
+    search_term: str = Form(""),
+    include_groups: bool = Form(False)
+):
+    """Exportar usuarios de la base local o de Active Directory"""
+    if not EXPORT_AVAILABLE or not export_service:
+        raise HTTPException(status_code=503, detail="Export service not available")
+    
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format: {format}")
+    
+    media_type, extension = EXPORT_FORMATS[format]
+    filename = f"usuarios_{source}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    
+    if source == "ad":
+        if not AD_AVAILABLE or not ad_service:
+            raise HTTPException(status_code=503, detail="Active Directory service not available")
+        
+        # Búsqueda paginada: recorre todo el directorio, no solo la primera página
+        rows = export_sources.iter_ad_users(ad_service, search_term, include_groups)
+        columns = export_sources.ad_user_columns(include_groups)
+    else:
+        rows = export_sources.iter_local_users(search_term or None)
+        columns = export_sources.LOCAL_USER_COLUMNS
+    
+    if format in STREAMING_FORMATS:
+        # CSV, JSON y NDJSON se envían a medida que se leen (StreamingResponse
+        # recorre el generador en el threadpool, sin bloquear el event loop)
+        return StreamingResponse(export_service.stream(format, rows), media_type=media_type, headers=headers)
+    
+    # Excel (write-only) y Parquet/Arrow consumen las filas según llegan y
+    # se generan fuera del event loop
+    if format == "excel":
+        build, args = export_service.export_to_excel, (rows, filename)
+    else:
+        if not ARROW_AVAILABLE:
+            raise HTTPException(status_code=503, detail="pyarrow is not installed")
+        build, args = export_service.export_columnar, (format, rows, columns)
+    
+    try:
+        if source == "ad":
+            content = await ad_service.run_async(build, *args, timeout=ad_service.export_timeout)
+        else:
+            content = await run_in_threadpool(build, *args)
+    except ADTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    return StreamingResponse(export_service.iter_file(content), media_type=media_type, headers=headers)
+
 # Mantener las rutas originales para compatibilidad
 @router.get("/create", response_class=HTMLResponse)
-async def create_user_form(request: Request, db: Session = Depends(get_db)):
-    departments = db.query(models.Department).all()
+async def create_user_form(request: Request, db: AsyncSession = Depends(get_db)):
+    departments = await crud.get_departments(db)
     return templates.TemplateResponse(
         "users/create.html",
         {"request": request, "departments": departments}
@@ -248,10 +480,10 @@ async def create_user(
     email: str = Form(...),
     full_name: str = Form(...),
     department_id: int = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     # Verificar si el email ya existe
-    existing_user = db.query(models.User).filter(models.User.email == email).first()
+    existing_user = await crud.get_user_by_email(db, email)
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
@@ -260,25 +492,20 @@ async def create_user(
         full_name=full_name,
         department_id=department_id
     )
-    crud.create_user(db, user)
+    await crud.create_user(db, user)
     return RedirectResponse(url="/users", status_code=302)
 
 @router.get("/{user_id}", response_class=HTMLResponse)
-async def view_user(request: Request, user_id: int, db: Session = Depends(get_db)):
-    user = crud.get_user(db, user_id)
+async def view_user(request: Request, user_id: int, db: AsyncSession = Depends(get_db)):
+    user = await crud.get_user(db, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     # Obtener asignaciones activas del usuario
-    active_assignments = db.query(models.Assignment).filter(
-        models.Assignment.user_id == user_id,
-        models.Assignment.returned_date == None
-    ).all()
+    active_assignments = await crud.get_user_assignments(db, user_id, active_only=True)
     
     # Obtener historial de asignaciones
-    assignment_history = db.query(models.Assignment).filter(
-        models.Assignment.user_id == user_id
-    ).order_by(models.Assignment.assigned_date.desc()).all()
+    assignment_history = await crud.get_user_assignments(db, user_id)
     
     return templates.TemplateResponse(
         "users/detail.html",
@@ -0,0 +1,73 @@
+# app/services/ad_cache.py - Cache en disco para datos del directorio
+
+from typing import Any, Optional
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+
+class ADDiskCache:
+    """Cache JSON en disco que sobrevive a reinicios y se comparte entre workers.
+
+    Cada entrada se guarda en un fichero cuyo nombre incluye un hash de la
+    clave (servidor, base DN...), de modo que un cambio de configuración
+    apunta a otra entrada en lugar de reutilizar datos obsoletos.
+    """
+
+    def __init__(self, directory: Optional[str] = None, logger: Optional[logging.Logger] = None):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), "inventario_ad_cache")
+        self.logger = logger or logging.getLogger(__name__)
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """Hash estable de las partes que identifican una entrada"""
+        raw = "|".join(str(part) for part in parts)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, name: str, key: str) -> str:
+        return os.path.join(self.directory, f"{name}_{key[:16]}.json")
+
+    def load(self, name: str, key: str, ttl: Optional[float] = None) -> Optional[Any]:
+        """Leer una entrada; None si no existe, ha caducado o no es legible"""
+        path = self._path(name, key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable AD cache file {path}: {e}")
+            return None
+
+        if payload.get("key") != key:
+            return None
+
+        if ttl is not None and time.time() - payload.get("created_at", 0) > ttl:
+            self.logger.info(f"AD cache entry '{name}' expired")
+            return None
+
+        return payload.get("value")
+
+    def save(self, name: str, key: str, value: Any):
+        """Guardar una entrada de forma atómica (escritura + rename)"""
+        path = self._path(name, key)
+        payload = {"key": key, "created_at": time.time(), "value": value}
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(payload, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            self.logger.warning(f"Could not write AD cache file {path}: {e}")
+
+    def invalidate(self, name: str, key: str):
+        try:
+            os.remove(self._path(name, key))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self.logger.warning(f"Could not remove AD cache entry '{name}': {e}")
@@ -1,13 +1,50 @@
 # app/services/ad_service.py - Versión adaptativa con detección dinámica de atributos
 
-from ldap3 import Server, Connection, ALL, SUBTREE, ALL_ATTRIBUTES
-from typing import List, Dict, Optional, Tuple
+from ldap3 import Server, Connection, ALL, BASE, SUBTREE, ALL_ATTRIBUTES
+from ldap3.utils.conv import escape_filter_chars
+from ldap3.core.exceptions import LDAPBindError, LDAPCommunicationError, LDAPSocketOpenError
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Callable, Iterator, List, Dict, Optional, Tuple, TypeVar
+import asyncio
+import copy
 import os
+import threading
 from dotenv import load_dotenv
 import logging
 
+from .ad_cache import ADDiskCache
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .ldap_pool import LDAPConnectionPool, LDAPPoolTimeoutError
+from .result_cache import TTLLRUCache
+
 load_dotenv()
 
+T = TypeVar("T")
+
+# OID del control Simple Paged Results (RFC 2696)
+PAGED_RESULTS_CONTROL = '1.2.840.113556.1.4.319'
+
+# OID de LDAP_MATCHING_RULE_IN_CHAIN: AD resuelve la pertenencia transitiva
+MATCHING_RULE_IN_CHAIN = '1.2.840.113556.1.4.1941'
+
+# DNs por filtro OR al recorrer grupos anidados nivel a nivel
+GROUP_BFS_BATCH_SIZE = 50
+
+# Errores que indican que el controlador de dominio no está disponible
+# (cuentan para el circuit breaker; un filtro inválido, por ejemplo, no)
+BACKEND_FAILURES = (LDAPCommunicationError, LDAPBindError, LDAPPoolTimeoutError)
+
+class ADTimeoutError(Exception):
+    """Una operación de AD superó el tiempo máximo de espera"""
+
+
+class ADSearchIncompleteError(Exception):
+    """AD terminó la búsqueda sin devolver todos los resultados
+    (sizeLimitExceeded, timeLimitExceeded, adminLimitExceeded...)"""
+
+
 class ActiveDirectoryService:
     def __init__(self):
         # Configurar logging
@@ -17,12 +54,53 @@ class ActiveDirectoryService:
         # Cargar y validar configuración
         self._load_config()
         
-        # Cache para formato de credenciales exitoso
+        # Cache para formato de credenciales exitoso (el lock evita que el
+        # pool, el executor y resolve_groups lancen a la vez su propia prueba)
         self._successful_credential_format = None
+        self._credential_lock = threading.Lock()
         
-        # Cache para atributos disponibles
+        # Cache para atributos disponibles (en memoria y en disco)
         self._available_attributes = None
         self._tested_attributes = False
+        self._disk_cache = ADDiskCache(self.cache_dir, logger=self.logger)
+        
+        # Servidor compartido por todas las conexiones (conserva el esquema
+        # descargado en la primera conexión)
+        self._server = None
+        self._server_info_loaded = False
+        
+        # Pool de conexiones ya autenticadas
+        self._pool = LDAPConnectionPool(
+            self._create_connection,
+            max_size=self.pool_size,
+            idle_timeout=self.pool_idle_timeout,
+            health_check_interval=self.pool_health_check_interval,
+            acquire_timeout=self.connect_timeout,
+            logger=self.logger
+        )
+        
+        # Hilos para la API asíncrona: acotados para que un DC lento no
+        # acumule hilos bloqueados sin límite
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.async_workers,
+            thread_name_prefix="ad-service"
+        )
+        
+        # Cache de resultados de búsquedas, usuarios y grupos
+        self._result_cache = TTLLRUCache(
+            max_size=self.result_cache_size,
+            ttl=self.result_cache_ttl,
+            stale_ttl=self.result_cache_stale_ttl
+        )
+        
+        # Tras varios fallos seguidos se deja de intentar conectar durante
+        # un tiempo (sin esperar timeouts ni volver a probar credenciales)
+        self._breaker = CircuitBreaker(
+            "Active Directory",
+            failure_threshold=self.breaker_failure_threshold,
+            reset_timeout=self.breaker_reset_timeout,
+            logger=self.logger
+        )
     
     def _load_config(self):
         """Cargar configuración desde variables de entorno"""
@@ -34,6 +112,44 @@ class ActiveDirectoryService:
         self.bind_password = os.getenv("AD_BIND_PASSWORD", "").strip()
         self.user_search_base = os.getenv("AD_USER_SEARCH_BASE", self.base_dn).strip()
         
+        # Cache en disco de datos del directorio
+        self.cache_dir = os.getenv("AD_CACHE_DIR", "").strip() or None
+        self.attribute_cache_ttl = int(os.getenv("AD_ATTRIBUTE_CACHE_TTL", 86400))
+        # Cache en memoria de resultados (0 desactiva)
+        self.result_cache_size = int(os.getenv("AD_RESULT_CACHE_SIZE", 1024))
+        self.result_cache_ttl = int(os.getenv("AD_RESULT_CACHE_TTL", 300))
+        # Tiempo extra que se sirven resultados caducados si AD no responde
+        self.result_cache_stale_ttl = int(os.getenv("AD_RESULT_CACHE_STALE_TTL", 3600))
+        # Circuit breaker
+        self.breaker_failure_threshold = int(os.getenv("AD_BREAKER_FAILURE_THRESHOLD", 5))
+        self.breaker_reset_timeout = int(os.getenv("AD_BREAKER_RESET_TIMEOUT", 30))
+        
+        # Timeouts y pool de conexiones
+        self.connect_timeout = int(os.getenv("AD_CONNECT_TIMEOUT", 10))
+        self.receive_timeout = int(os.getenv("AD_RECEIVE_TIMEOUT", 30))
+        self.pool_size = int(os.getenv("AD_POOL_SIZE", 5))
+        self.pool_idle_timeout = int(os.getenv("AD_POOL_IDLE_TIMEOUT", 300))
+        self.pool_health_check_interval = int(os.getenv("AD_POOL_HEALTH_CHECK_INTERVAL", 60))
+        # Tamaño de página de las búsquedas (por debajo del MaxPageSize de AD)
+        self.page_size = int(os.getenv("AD_PAGE_SIZE", 500))
+        # Timeout de cada intento al buscar el formato de credencial
+        self.credential_probe_timeout = int(os.getenv("AD_CREDENTIAL_PROBE_TIMEOUT", 3))
+        # Nombres por filtro OR en las búsquedas por lotes (límite de
+        # longitud de filtro de AD)
+        self.batch_chunk_size = int(os.getenv("AD_BATCH_CHUNK_SIZE", 100))
+        # API asíncrona: hilos del executor y tiempo máximo por llamada
+        self.async_workers = int(os.getenv("AD_ASYNC_WORKERS", self.pool_size * 2))
+        self.call_timeout = float(os.getenv("AD_CALL_TIMEOUT", self.connect_timeout + self.receive_timeout))
+        # Las exportaciones recorren todo el directorio: límite propio
+        self.export_timeout = float(os.getenv("AD_EXPORT_TIMEOUT", 600))
+        # Resolución de grupos anidados: "in_chain" (una consulta por usuario)
+        # o "bfs" (por niveles, para servidores sin la regla de AD)
+        self.group_resolution = os.getenv("AD_GROUP_RESOLUTION", "in_chain").lower().strip()
+        # Descargar esquema e info del DSE solo en la primera conexión
+        self.skip_schema_after_first_connect = os.getenv(
+            "AD_SKIP_SCHEMA_AFTER_FIRST_CONNECT", "true"
+        ).lower().strip() == "true"
+        
         # Log de configuración (sin mostrar contraseña)
         self.logger.info(f"AD Config - Host: {self.server_host}, Port: {self.server_port}")
         self.logger.info(f"AD Config - Base DN: {self.base_dn}")
@@ -55,71 +171,44 @@ class ActiveDirectoryService:
             self.logger.error(error_msg)
             raise ValueError(error_msg)
     
+    # Atributos de usuario que el servicio sabe interpretar
+    ATTRIBUTES_TO_TEST = [
+        'cn', 'sAMAccountName', 'displayName', 'name', 'givenName', 'sn',
+        'mail', 'userPrincipalName', 'distinguishedName', 
+        'department', 'title', 'telephoneNumber', 'mobile',
+        'physicalDeliveryOfficeName', 'company', 'manager',
+        'employeeID', 'employeeNumber', 'whenCreated', 'lastLogon',
+        'memberOf', 'objectClass', 'objectCategory'
+    ]
+    
+    def _directory_cache_key(self) -> str:
+        """Clave de cache del directorio: servidor y base de búsqueda"""
+        return ADDiskCache.make_key(self.server_host, self.server_port, self.user_search_base)
+    
     def _discover_available_attributes(self, conn: Connection) -> Dict[str, bool]:
         """Descubrir qué atributos están disponibles en este AD"""
         
         if self._available_attributes is not None:
             return self._available_attributes
         
-        self.logger.info("Discovering available attributes in AD schema...")
+        # Resultado de un arranque anterior (u otro worker)
+        cache_key = self._directory_cache_key()
+        cached = self._disk_cache.load("attributes", cache_key, ttl=self.attribute_cache_ttl)
+        if cached:
+            self.logger.info("Using cached AD attribute discovery")
+            self._available_attributes = cached
+            self._tested_attributes = True
+            return cached
         
-        # Lista de atributos a probar
-        attributes_to_test = [
-            'cn', 'sAMAccountName', 'displayName', 'name', 'givenName', 'sn',
-            'mail', 'userPrincipalName', 'distinguishedName', 
-            'department', 'title', 'telephoneNumber', 'mobile',
-            'physicalDeliveryOfficeName', 'company', 'manager',
-            'employeeID', 'employeeNumber', 'whenCreated', 'lastLogon',
-            'memberOf', 'objectClass', 'objectCategory'
-        ]
+        self.logger.info("Discovering available attributes in AD schema...")
         
-        available = {}
+        # Método 1: consultar el esquema ya descargado por el servidor (sin
+        # ninguna búsqueda adicional)
+        available = self._discover_attributes_from_schema(conn)
         
-        # Método 1: Probar cada atributo individualmente
-        for attr in attributes_to_test:
-            try:
-                test_result = conn.search(
-                    search_base=self.user_search_base,
-                    search_filter="(&(objectClass=user)(objectCategory=person))",
-                    search_scope=SUBTREE,
-                    attributes=[attr],
-                    size_limit=1
-                )
-                
-                if test_result and conn.entries:
-                    available[attr] = True
-                    self.logger.debug(f"✅ Attribute available: {attr}")
-                else:
-                    available[attr] = False
-                    self.logger.debug(f"❌ Attribute not available: {attr}")
-                    
-            except Exception as e:
-                available[attr] = False
-                self.logger.debug(f"❌ Attribute error {attr}: {str(e)}")
-        
-        # Método 2: Si el método 1 falla, usar ALL_ATTRIBUTES en una consulta
+        # Método 2: una única búsqueda con ALL_ATTRIBUTES sobre un usuario
         if not any(available.values()):
-            try:
-                self.logger.info("Trying ALL_ATTRIBUTES discovery method...")
-                test_result = conn.search(
-                    search_base=self.user_search_base,
-                    search_filter="(&(objectClass=user)(objectCategory=person))",
-                    search_scope=SUBTREE,
-                    attributes=ALL_ATTRIBUTES,
-                    size_limit=1
-                )
-                
-                if test_result and conn.entries:
-                    entry = conn.entries[0]
-                    actual_attributes = list(entry._attributes.keys())
-                    self.logger.info(f"Discovered {len(actual_attributes)} attributes via ALL_ATTRIBUTES")
-                    
-                    # Marcar atributos encontrados como disponibles
-                    for attr in attributes_to_test:
-                        available[attr] = attr in actual_attributes
-                        
-            except Exception as e:
-                self.logger.warning(f"ALL_ATTRIBUTES discovery failed: {e}")
+            available = self._discover_attributes_with_probe(conn)
         
         # Fallback: usar solo atributos absolutamente básicos
         if not any(available.values()):
@@ -129,6 +218,8 @@ class ActiveDirectoryService:
                 'distinguishedName': True,
                 'objectClass': True
             }
+        else:
+            self._disk_cache.save("attributes", cache_key, available)
         
         self._available_attributes = available
         self._tested_attributes = True
@@ -139,6 +230,40 @@ class ActiveDirectoryService:
         
         return available
     
+    def _discover_attributes_from_schema(self, conn: Connection) -> Dict[str, bool]:
+        """Comprobar los atributos contra el esquema leído en la primera conexión"""
+        schema = conn.server.schema if conn.server else None
+        if not schema or not schema.attribute_types:
+            return {}
+        
+        self.logger.info("Discovering attributes from server schema")
+        return {attr: attr in schema.attribute_types for attr in self.ATTRIBUTES_TO_TEST}
+    
+    def _discover_attributes_with_probe(self, conn: Connection) -> Dict[str, bool]:
+        """Leer todos los atributos de un usuario en una sola búsqueda"""
+        try:
+            self.logger.info("Trying ALL_ATTRIBUTES discovery method...")
+            test_result = conn.search(
+                search_base=self.user_search_base,
+                search_filter="(&(objectClass=user)(objectCategory=person))",
+                search_scope=SUBTREE,
+                attributes=ALL_ATTRIBUTES,
+                size_limit=1
+            )
+            
+            if test_result and conn.entries:
+                entry = conn.entries[0]
+                actual_attributes = {attr.lower() for attr in entry.entry_attributes}
+                actual_attributes.add('distinguishedname')
+                self.logger.info(f"Discovered {len(actual_attributes)} attributes via ALL_ATTRIBUTES")
+                
+                return {attr: attr.lower() in actual_attributes for attr in self.ATTRIBUTES_TO_TEST}
+                
+        except Exception as e:
+            self.logger.warning(f"ALL_ATTRIBUTES discovery failed: {e}")
+        
+        return {}
+    
     def _get_safe_attributes(self, conn: Connection) -> List[str]:
         """Obtener lista de atributos seguros para usar en consultas"""
         
@@ -156,46 +281,161 @@ class ActiveDirectoryService:
         
         return safe_attrs
     
-    def _get_connection(self) -> Optional[Connection]:
-        """Crear conexión a Active Directory"""
-        try:
-            # Validar configuración
-            self._validate_config()
-            
-            self.logger.info(f"Connecting to AD: {self.server_host}:{self.server_port}")
-            
-            server = Server(
+    def _get_server(self) -> Server:
+        """Servidor LDAP compartido por las conexiones del pool"""
+        if self._server is None:
+            self._server = Server(
                 self.server_host, 
                 port=self.server_port, 
                 use_ssl=self.use_ssl, 
-                get_info=ALL
+                get_info=ALL,
+                connect_timeout=self.connect_timeout
             )
-            
-            # Probar diferentes formatos de usuario si no tenemos uno exitoso
-            if not self._successful_credential_format:
-                self._successful_credential_format = self._find_working_credential()
-            
-            if not self._successful_credential_format:
-                self.logger.error("No working credential format found")
-                return None
-            
-            conn = Connection(
-                server,
-                user=self._successful_credential_format,
-                password=self.bind_password,
-                auto_bind=True
-            )
-            
-            self.logger.info("Successfully connected to Active Directory")
-            return conn
-            
-        except Exception as e:
-            self.logger.error(f"Error connecting to AD: {str(e)}")
-            return None
+        return self._server
+    
+    def _create_connection(self) -> Connection:
+        """Crear y autenticar una nueva conexión a Active Directory (usado por el pool)"""
+        # Validar configuración
+        self._validate_config()
+        
+        self.logger.info(f"Connecting to AD: {self.server_host}:{self.server_port}")
+        
+        # Probar diferentes formatos de usuario si no tenemos uno exitoso
+        user_format = self._successful_credential_format
+        if not user_format:
+            with self._credential_lock:
+                user_format = self._successful_credential_format
+                if not user_format:
+                    user_format = self._successful_credential_format = self._find_working_credential()
+        
+        if not user_format:
+            raise LDAPBindError("No working credential format found")
+        
+        conn = Connection(
+            self._get_server(),
+            user=user_format,
+            password=self.bind_password,
+            receive_timeout=self.receive_timeout
+        )
+        
+        # El esquema y la info del DSE quedan en el objeto Server tras la
+        # primera conexión; no hace falta volver a descargarlos en cada bind
+        read_server_info = not (self.skip_schema_after_first_connect and self._server_info_loaded)
+        if not conn.bind(read_server_info=read_server_info):
+            # El formato guardado puede haber dejado de ser válido
+            self._forget_credential_format()
+            raise LDAPBindError(f"Bind failed: {conn.result.get('description') if conn.result else 'unknown'}")
+        
+        if read_server_info:
+            self._server_info_loaded = True
+        
+        self.logger.info("Successfully connected to Active Directory")
+        return conn
+    
+    @contextmanager
+    def _connection(self):
+        """Obtener una conexión del pool (usar con ``with``).
+        
+        Pasa por el circuit breaker: con el circuito abierto lanza
+        CircuitOpenError sin tocar la red.
+        """
+        self._breaker.before_call()
+        try:
+            with self._pool.connection() as conn:
+                yield conn
+        except BACKEND_FAILURES as e:
+            self._breaker.record_failure(e)
+            raise
+        except BaseException:
+            # AD respondió (o el consumidor abandonó el generador)
+            self._breaker.record_success()
+            raise
+        else:
+            self._breaker.record_success()
+    
+    def _with_connection(self, operation: Callable[[Connection], T]) -> T:
+        """Ejecutar una operación con una conexión del pool.
+        
+        Si la conexión reutilizada se había cerrado en el servidor se
+        descarta y la operación se reintenta una vez con una nueva.
+        """
+        try:
+            with self._connection() as conn:
+                return operation(conn)
+        except LDAPSocketOpenError:
+            raise
+        except LDAPCommunicationError as e:
+            self.logger.warning(f"AD connection lost, reconnecting: {e}")
+            with self._connection() as conn:
+                return operation(conn)
+    
+    def close(self):
+        """Cerrar las conexiones inactivas del pool y el executor"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._pool.close()
+    
+    # API asíncrona para los routers: las llamadas bloqueantes de ldap3 se
+    # ejecutan en el executor propio del servicio y se espera como máximo
+    # ``timeout`` segundos. Si la petición se cancela o caduca, una llamada
+    # que aún no había empezado no llega a ejecutarse; una que ya está en
+    # curso termina en su hilo (acotada por AD_RECEIVE_TIMEOUT) y su
+    # resultado se descarta.
+    
+    async def run_async(self, func: Callable[..., T], *args, timeout: Optional[float] = None, **kwargs) -> T:
+        """Ejecutar una función bloqueante del servicio sin bloquear el event loop"""
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+        timeout = self.call_timeout if timeout is None else timeout
+        
+        try:
+            return await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            self.logger.warning(f"AD call {getattr(func, '__name__', func)} timed out after {timeout}s")
+            self._breaker.record_failure(ADTimeoutError(f"Timed out after {timeout}s"))
+            raise ADTimeoutError(f"Active Directory did not respond within {timeout}s")
+    
+    async def search_users_async(self, search_term: str = "", max_results: int = 100, timeout: Optional[float] = None) -> List[Dict]:
+        """search_users sin bloquear; si AD no responde a tiempo se sirve la
+        copia caducada de la cache, si la hay"""
+        try:
+            return await self.run_async(self.search_users, search_term, max_results, timeout=timeout)
+        except ADTimeoutError as e:
+            return self._stale_or_raise(self._search_cache_key(search_term, max_results), e, reraise=True)
+    
+    async def get_user_by_username_async(self, username: str, timeout: Optional[float] = None) -> Optional[Dict]:
+        return await self.run_async(self.get_user_by_username, username, timeout=timeout)
+    
+    async def get_users_by_usernames_async(
+        self,
+        usernames: List[str],
+        chunk_size: Optional[int] = None,
+        timeout: Optional[float] = None
+    ) -> Dict[str, Optional[Dict]]:
+        return await self.run_async(self.get_users_by_usernames, usernames, chunk_size, timeout=timeout)
+    
+    async def get_user_groups_async(self, username: str, timeout: Optional[float] = None) -> List[str]:
+        return await self.run_async(self.get_user_groups, username, timeout=timeout)
+    
+    async def resolve_groups_async(
+        self,
+        usernames: List[str],
+        nested: bool = True,
+        timeout: Optional[float] = None
+    ) -> Dict[str, Optional[List[str]]]:
+        return await self.run_async(self.resolve_groups, usernames, nested, timeout=timeout)
+    
+    async def test_connection_async(self, timeout: Optional[float] = None) -> Dict:
+        return await self.run_async(self.test_connection, timeout=timeout)
     
     def _find_working_credential(self) -> Optional[str]:
         """Encontrar formato de credencial que funcione"""
         
+        # Formato descubierto en un arranque anterior con la misma configuración
+        cached_format = self._disk_cache.load("credential", self._credential_cache_key())
+        if cached_format:
+            self.logger.info(f"Using cached credential format: {cached_format}")
+            return cached_format
+        
         original_user = self.bind_user
         base_dn = self.base_dn
         
@@ -228,106 +468,294 @@ class ActiveDirectoryService:
             f"CN={username_part},OU=Users,{base_dn}",  # DN en OU Users
         ]
         
-        server = Server(self.server_host, port=self.server_port, use_ssl=self.use_ssl)
+        # Quitar vacíos y duplicados conservando la prioridad
+        formats_to_try = list(dict.fromkeys(f for f in formats_to_try if f))
         
+        # De uno en uno y parando en el primero que funcione: cada bind
+        # fallido cuenta para el bloqueo de la cuenta de servicio
         for user_format in formats_to_try:
-            if not user_format:
-                continue
-                
-            self.logger.info(f"Trying credential format: {user_format}")
-            
-            try:
-                test_conn = Connection(
-                    server,
-                    user=user_format,
-                    password=self.bind_password,
-                    auto_bind=True
-                )
-                test_conn.unbind()
-                
+            if self._try_credential_format(user_format):
                 self.logger.info(f"SUCCESS: Working credential format: {user_format}")
+                self._disk_cache.save("credential", self._credential_cache_key(), user_format)
                 return user_format
-                
-            except Exception as e:
-                self.logger.debug(f"Failed credential format {user_format}: {str(e)}")
-                continue
         
         self.logger.error("No working credential format found")
         return None
     
+    def _try_credential_format(self, user_format: str) -> bool:
+        """Intentar un bind con un formato de usuario concreto"""
+        self.logger.info(f"Trying credential format: {user_format}")
+        
+        server = Server(
+            self.server_host,
+            port=self.server_port,
+            use_ssl=self.use_ssl,
+            connect_timeout=self.credential_probe_timeout
+        )
+        
+        try:
+            test_conn = Connection(
+                server,
+                user=user_format,
+                password=self.bind_password,
+                receive_timeout=self.credential_probe_timeout,
+                auto_bind=True
+            )
+            test_conn.unbind()
+            return True
+            
+        except Exception as e:
+            self.logger.debug(f"Failed credential format {user_format}: {str(e)}")
+            return False
+    
+    def _credential_cache_key(self) -> str:
+        """Clave de cache del formato de credencial: cambia si cambia la configuración"""
+        return ADDiskCache.make_key(self.server_host, self.server_port, self.bind_user, self.base_dn)
+    
+    def _forget_credential_format(self):
+        """Descartar el formato de credencial guardado (p. ej. tras un bind fallido)"""
+        self._successful_credential_format = None
+        self._disk_cache.invalidate("credential", self._credential_cache_key())
+    
+    @staticmethod
+    def _search_cache_key(search_term: str, max_results: int) -> Tuple:
+        return ("search", (search_term or "").strip().lower(), max_results)
+    
     def search_users(self, search_term: str = "", max_results: int = 100) -> List[Dict]:
         """Buscar usuarios en Active Directory con detección automática de atributos"""
+        cache_key = self._search_cache_key(search_term, max_results)
+        cached = self._result_cache.get(cache_key)
+        if cached is not None:
+            return copy.deepcopy(cached)
+        
         try:
             self.logger.info(f"Searching users with term: '{search_term}'")
             
-            conn = self._get_connection()
-            if not conn:
-                self.logger.error("Could not establish AD connection")
-                return []
+            users = self._with_connection(
+                lambda conn: list(self._iter_users(conn, search_term, max_results))
+            )
             
-            try:
-                # Descubrir atributos disponibles
-                safe_attributes = self._get_safe_attributes(conn)
-                self.logger.info(f"Using safe attributes: {safe_attributes[:5]}...")
-                
-                # Construir filtro de búsqueda adaptativo
-                if search_term:
-                    # Usar atributos disponibles para el filtro
-                    filter_conditions = []
-                    
-                    if 'cn' in safe_attributes:
-                        filter_conditions.append(f"(cn=*{search_term}*)")
-                    if 'displayName' in safe_attributes:
-                        filter_conditions.append(f"(displayName=*{search_term}*)")
-                    if 'sAMAccountName' in safe_attributes:
-                        filter_conditions.append(f"(sAMAccountName=*{search_term}*)")
-                    if 'mail' in safe_attributes:
-                        filter_conditions.append(f"(mail=*{search_term}*)")
-                    if 'givenName' in safe_attributes:
-                        filter_conditions.append(f"(givenName=*{search_term}*)")
-                    
-                    # Si no tenemos atributos de búsqueda, usar cn por defecto
-                    if not filter_conditions:
-                        filter_conditions = [f"(cn=*{search_term}*)"]
-                    
-                    search_filter = f"(&(objectClass=user)(objectCategory=person)(|{''.join(filter_conditions)}))"
-                else:
-                    search_filter = "(&(objectClass=user)(objectCategory=person))"
-                
-                self.logger.info(f"Searching in base: {self.user_search_base}")
-                self.logger.info(f"Using filter: {search_filter}")
-                
-                search_result = conn.search(
-                    search_base=self.user_search_base,
-                    search_filter=search_filter,
-                    search_scope=SUBTREE,
-                    attributes=safe_attributes,
-                    size_limit=max_results
+        except Exception as e:
+            self.logger.error(f"Error searching users: {str(e)}")
+            return self._stale_or_raise(cache_key, e, default=[], reraise=isinstance(e, BACKEND_FAILURES))
+        
+        self._result_cache.set(cache_key, copy.deepcopy(users))
+        return users
+    
+    def paged_search_users(
+        self,
+        search_term: str = "",
+        max_results: Optional[int] = None,
+        include_groups: bool = False
+    ) -> Iterator[Dict]:
+        """Recorrer los usuarios que coinciden página a página (Simple Paged Results).
+        
+        Generador: la conexión del pool se mantiene mientras se consume y
+        solo hay una página en memoria, así que sirve para directorios más
+        grandes que el MaxPageSize del servidor.
+        """
+        self.logger.info(f"Paged search of users with term: '{search_term}'")
+        
+        with self._connection() as conn:
+            yield from self._iter_users(conn, search_term, max_results, include_groups)
+    
+    def _build_user_filter(self, search_term: str, safe_attributes: List[str]) -> str:
+        """Construir filtro de búsqueda adaptativo"""
+        if not search_term:
+            return "(&(objectClass=user)(objectCategory=person))"
+        
+        # Usar atributos disponibles para el filtro
+        filter_conditions = []
+        
+        if 'cn' in safe_attributes:
+            filter_conditions.append(f"(cn=*{search_term}*)")
+        if 'displayName' in safe_attributes:
+            filter_conditions.append(f"(displayName=*{search_term}*)")
+        if 'sAMAccountName' in safe_attributes:
+            filter_conditions.append(f"(sAMAccountName=*{search_term}*)")
+        if 'mail' in safe_attributes:
+            filter_conditions.append(f"(mail=*{search_term}*)")
+        if 'givenName' in safe_attributes:
+            filter_conditions.append(f"(givenName=*{search_term}*)")
+        
+        # Si no tenemos atributos de búsqueda, usar cn por defecto
+        if not filter_conditions:
+            filter_conditions = [f"(cn=*{search_term}*)"]
+        
+        return f"(&(objectClass=user)(objectCategory=person)(|{''.join(filter_conditions)}))"
+    
+    def _iter_users(
+        self,
+        conn: Connection,
+        search_term: str,
+        max_results: Optional[int] = None,
+        include_groups: bool = False,
+        search_filter: Optional[str] = None,
+        extra_attributes: Optional[List[str]] = None
+    ) -> Iterator[Dict]:
+        """Búsqueda paginada de usuarios sobre una conexión ya obtenida del pool"""
+        # Descubrir atributos disponibles
+        safe_attributes = self._get_safe_attributes(conn)
+        self.logger.info(f"Using safe attributes: {safe_attributes[:5]}...")
+        
+        if search_filter is None:
+            search_filter = self._build_user_filter(search_term, safe_attributes)
+        
+        extra_attributes = extra_attributes or []
+        
+        self.logger.info(f"Searching in base: {self.user_search_base}")
+        self.logger.info(f"Using filter: {search_filter}")
+        
+        found = 0
+        cookie = None
+        
+        while True:
+            page_size = self.page_size
+            if max_results is not None:
+                page_size = min(page_size, max_results - found)
+            
+            search_result = conn.search(
+                search_base=self.user_search_base,
+                search_filter=search_filter,
+                search_scope=SUBTREE,
+                attributes=safe_attributes + extra_attributes,
+                paged_size=page_size,
+                paged_cookie=cookie
+            )
+            
+            # ldap3 devuelve True si hay entradas sea cual sea el código de
+            # resultado: un límite del servidor cortaría el recorrido en
+            # silencio y una sincronización completa borraría usuarios que
+            # siguen existiendo
+            result_code = (conn.result or {}).get('result', 0)
+            if result_code != 0:
+                raise ADSearchIncompleteError(
+                    f"User search ended with result {result_code} "
+                    f"({conn.result.get('description')}) after {found} entries"
                 )
-                
-                if not search_result:
+            
+            if not search_result:
+                if found == 0:
                     self.logger.warning(f"Search returned no results. Response: {conn.result}")
-                    return []
+                break
+            
+            for entry in list(conn.entries):
+                try:
+                    user_data = self._extract_user_data_adaptive(entry, safe_attributes)
+                except Exception as e:
+                    self.logger.warning(f"Error processing user entry: {e}")
+                    continue
                 
-                users = []
-                for entry in conn.entries:
-                    try:
-                        user_data = self._extract_user_data_adaptive(entry, safe_attributes)
-                        if user_data:
-                            users.append(user_data)
-                    except Exception as e:
-                        self.logger.warning(f"Error processing user entry: {e}")
-                        continue
+                if not user_data:
+                    continue
                 
-                self.logger.info(f"Successfully found {len(users)} users")
-                return users
+                if include_groups:
+                    user_data['groups'] = self._group_names(entry)
                 
-            finally:
-                conn.unbind()
+                for attr in extra_attributes:
+                    user_data[attr] = entry[attr].value if attr in entry else None
                 
-        except Exception as e:
-            self.logger.error(f"Error searching users: {str(e)}")
-            return []
+                found += 1
+                yield user_data
+                
+                if max_results is not None and found >= max_results:
+                    self.logger.info(f"Successfully found {found} users (limit reached)")
+                    return
+            
+            cookie = (conn.result.get('controls', {})
+                      .get(PAGED_RESULTS_CONTROL, {})
+                      .get('value', {})
+                      .get('cookie'))
+            if not cookie:
+                break
+        
+        self.logger.info(f"Successfully found {found} users")
+    
+    @contextmanager
+    def sync_connection(self):
+        """Conexión del pool para una sincronización (usar con ``with``).
+        
+        Los USN son propios de cada controlador de dominio: la marca de agua
+        (``read_dc_info``) y la búsqueda de cambios (``iter_changed_users``)
+        deben hacerse sobre la misma conexión para que vayan al mismo DC.
+        """
+        with self._connection() as conn:
+            yield conn
+    
+    def read_dc_info(self, conn: Connection) -> Dict:
+        """Identidad del DC de la conexión y su highestCommittedUSN (rootDSE).
+        
+        ``invocation_id`` se lee del objeto NTDS Settings (dsServiceName) y
+        cambia también si el DC se restaura de una copia de seguridad, con
+        lo que sus USN dejan de ser comparables con los anteriores.
+        """
+        def read(search_base: str) -> Dict:
+            # '*': los atributos del rootDSE (highestCommittedUSN,
+            # dsServiceName) no están en el esquema y ldap3 rechazaría
+            # pedirlos por nombre
+            conn.search(
+                search_base=search_base,
+                search_filter='(objectClass=*)',
+                search_scope=BASE,
+                attributes=[ALL_ATTRIBUTES]
+            )
+            entries = [r for r in conn.response or [] if r.get('type') == 'searchResEntry']
+            return entries[0].get('attributes', {}) if entries else {}
+        
+        def first(attributes: Dict, name: str):
+            value = attributes[name] if name in attributes else None
+            if isinstance(value, list):
+                value = value[0] if value else None
+            return value
+        
+        root = read('')
+        highest_usn = first(root, 'highestCommittedUSN')
+        info = {
+            "dns_host_name": first(root, 'dnsHostName'),
+            "invocation_id": None,
+            "highest_usn": int(highest_usn) if highest_usn is not None else None
+        }
+        
+        ds_service_name = first(root, 'dsServiceName')
+        if ds_service_name:
+            invocation_id = first(read(ds_service_name), 'invocationId')
+            if invocation_id is not None:
+                info["invocation_id"] = str(invocation_id)
+        
+        return info
+    
+    def iter_changed_users(self, conn: Connection, since_usn: Optional[int] = None) -> Iterator[Dict]:
+        """Usuarios con uSNChanged posterior a since_usn (todos si es None).
+        
+        Cada usuario incluye uSNChanged y whenChanged para poder llevar la
+        marca de agua de una sincronización incremental. ``conn`` debe ser
+        la conexión de ``sync_connection`` en la que se leyó la marca.
+        """
+        search_filter = "(&(objectClass=user)(objectCategory=person))"
+        if since_usn is not None:
+            search_filter = f"(&(objectClass=user)(objectCategory=person)(uSNChanged>={since_usn + 1}))"
+        
+        return self._iter_users(
+            conn,
+            "",
+            search_filter=search_filter,
+            extra_attributes=['uSNChanged', 'whenChanged']
+        )
+    
+    @staticmethod
+    def _cn_from_dn(dn: str) -> str:
+        return str(dn).split(',')[0].replace('CN=', '')
+    
+    @classmethod
+    def _group_names(cls, entry) -> List[str]:
+        """Nombres (CN) de los grupos del atributo memberOf de una entrada"""
+        groups = []
+        
+        if hasattr(entry, 'memberOf') and entry.memberOf:
+            for group_dn in entry.memberOf:
+                groups.append(cls._cn_from_dn(group_dn))
+        
+        return groups
     
     def _extract_user_data_adaptive(self, entry, available_attributes: List[str]) -> Optional[Dict]:
         """Extraer datos del usuario usando solo atributos disponibles"""
@@ -413,56 +841,396 @@ class ActiveDirectoryService:
         """Obtener un usuario específico por username"""
         if not username or not username.strip():
             return None
+        
+        username = username.strip()
+        cache_key = ("user", username.lower())
+        cached = self._result_cache.get(cache_key)
+        if cached is not None:
+            return copy.deepcopy(cached)
+        
+        try:
+            user = self._with_connection(lambda conn: self._find_user(conn, username))
+        except Exception as e:
+            self.logger.error(f"Error getting user '{username}': {str(e)}")
+            return self._stale_or_raise(cache_key, e, default=None, reraise=isinstance(e, BACKEND_FAILURES))
+        
+        if user is None:
+            return None
+        
+        self._result_cache.set(cache_key, copy.deepcopy(user))
+        if 'groups' in user:
+            self._result_cache.set(("groups", username.lower()), list(user['groups']))
+        return user
+    
+    def get_users_by_usernames(
+        self,
+        usernames: List[str],
+        chunk_size: Optional[int] = None
+    ) -> Dict[str, Optional[Dict]]:
+        """Varios usuarios por nombre exacto (sAMAccountName o UPN) con sus grupos.
+        
+        Los que no están en cache se resuelven con una consulta OR por lote
+        de ``chunk_size`` nombres, todo sobre una misma conexión del pool.
+        Los que no existen quedan con None.
+        """
+        unique = list(dict.fromkeys(u.strip() for u in usernames if u and u.strip()))
+        results: Dict[str, Optional[Dict]] = {}
+        missing = []
+        
+        for username in unique:
+            cached = self._result_cache.get(("user", username.lower()))
+            if cached is not None:
+                results[username] = copy.deepcopy(cached)
+            else:
+                missing.append(username)
+        
+        if missing:
+            # La consulta OR de cada lote no se pagina: no puede pasar del
+            # tamaño de página o el servidor la cortaría
+            chunk_size = max(1, min(chunk_size or self.batch_chunk_size, self.page_size))
+            try:
+                found = self._with_connection(
+                    lambda conn: self._find_users_batch(conn, missing, chunk_size)
+                )
+            except BACKEND_FAILURES + (CircuitOpenError,) as e:
+                for username in missing:
+                    results[username] = self._stale_or_raise(("user", username.lower()), e, reraise=True)
+                return results
             
-        users = self.search_users(username.strip())
-        for user in users:
-            if user['username'].lower() == username.lower():
-                return user
-        return None
+            for username in missing:
+                user = found.get(username.lower())
+                results[username] = user
+                if user is not None:
+                    self._result_cache.set(("user", username.lower()), copy.deepcopy(user))
+                    if 'groups' in user:
+                        self._result_cache.set(("groups", username.lower()), list(user['groups']))
+        
+        return results
+    
+    def _find_users_batch(self, conn: Connection, usernames: List[str], chunk_size: int) -> Dict[str, Dict]:
+        """Usuarios indexados por sAMAccountName y userPrincipalName en minúsculas"""
+        safe_attrs = self._get_safe_attributes(conn)
+        found: Dict[str, Dict] = {}
+        # Solo se indexa por los atributos por los que filtra
+        # _exact_user_conditions: el cn de un usuario no debe tapar el
+        # sAMAccountName de otro de los pedidos
+        key_attrs = [attr for attr in ('sAMAccountName', 'userPrincipalName') if attr in safe_attrs] or ['cn']
+        
+        for start in range(0, len(usernames), chunk_size):
+            chunk = usernames[start:start + chunk_size]
+            conditions = ''.join(
+                condition
+                for username in chunk
+                for condition in self._exact_user_conditions(username, safe_attrs)
+            )
+            
+            # chunk_size está limitado al tamaño de página: no hace falta paginar
+            conn.search(
+                search_base=self.user_search_base,
+                search_filter=f"(&(objectClass=user)(|{conditions}))",
+                search_scope=SUBTREE,
+                attributes=safe_attrs
+            )
+            
+            # Un resultado cortado no debe dar usuarios por inexistentes
+            result_code = (conn.result or {}).get('result', 0)
+            if result_code != 0:
+                raise ADSearchIncompleteError(
+                    f"Batch user lookup ended with result {result_code} ({conn.result.get('description')})"
+                )
+            
+            for entry in conn.entries:
+                user = self._extract_user_data_adaptive(entry, safe_attrs)
+                if user is None:
+                    continue
+                if 'memberOf' in safe_attrs:
+                    user['groups'] = self._group_names(entry)
+                
+                for attr in key_attrs:
+                    if attr in entry and entry[attr].value:
+                        found[str(entry[attr].value).lower()] = user
+        
+        return found
+    
+    @staticmethod
+    def _exact_user_conditions(username: str, safe_attributes: List[str]) -> List[str]:
+        value = escape_filter_chars(username)
+        
+        conditions = []
+        if 'sAMAccountName' in safe_attributes:
+            conditions.append(f"(sAMAccountName={value})")
+        if 'userPrincipalName' in safe_attributes and '@' in username:
+            conditions.append(f"(userPrincipalName={value})")
+        if not conditions:
+            conditions.append(f"(cn={value})")
+        return conditions
+    
+    def _exact_user_filter(self, username: str, safe_attributes: List[str]) -> str:
+        """Filtro de igualdad (indexado en AD) por sAMAccountName o userPrincipalName"""
+        conditions = self._exact_user_conditions(username, safe_attributes)
+        if len(conditions) == 1:
+            return f"(&(objectClass=user){conditions[0]})"
+        return f"(&(objectClass=user)(|{''.join(conditions)}))"
+    
+    def _find_user(self, conn: Connection, username: str) -> Optional[Dict]:
+        """Un usuario por nombre exacto, con sus grupos (memberOf) en la misma consulta"""
+        safe_attrs = self._get_safe_attributes(conn)
+        
+        conn.search(
+            search_base=self.user_search_base,
+            search_filter=self._exact_user_filter(username, safe_attrs),
+            search_scope=SUBTREE,
+            attributes=safe_attrs,
+            size_limit=2
+        )
+        
+        if not conn.entries:
+            return None
+        
+        entry = conn.entries[0]
+        user = self._extract_user_data_adaptive(entry, safe_attrs)
+        if user is not None and 'memberOf' in safe_attrs:
+            user['groups'] = self._group_names(entry)
+        return user
     
     def get_user_groups(self, username: str) -> List[str]:
         """Obtener grupos de un usuario"""
         if not username or not username.strip():
             return []
-            
-        conn = self._get_connection()
-        if not conn:
-            return []
         
-        try:
-            # Usar atributo de búsqueda disponible
-            safe_attrs = self._get_safe_attributes(conn)
+        cache_key = ("groups", username.strip().lower())
+        cached = self._result_cache.get(cache_key)
+        if cached is not None:
+            return list(cached)
             
-            if 'sAMAccountName' in safe_attrs:
-                user_filter = f"(&(objectClass=user)(sAMAccountName={username.strip()}))"
-            else:
-                user_filter = f"(&(objectClass=user)(cn={username.strip()}))"
-            
-            conn.search(
-                search_base=self.user_search_base,
-                search_filter=user_filter,
-                attributes=['memberOf'] if 'memberOf' in safe_attrs else []
+        try:
+            groups = self._with_connection(
+                lambda conn: self._get_user_groups(conn, username.strip())
             )
             
-            if not conn.entries:
-                return []
+        except Exception as e:
+            self.logger.error(f"Error getting user groups: {str(e)}")
+            return self._stale_or_raise(cache_key, e, default=[])
+        
+        self._result_cache.set(cache_key, list(groups))
+        return groups
+    
+    def get_effective_groups(self, username: str) -> Optional[List[str]]:
+        """Grupos de un usuario incluyendo los anidados; None si no existe"""
+        return self.resolve_groups([username]).get(username.strip())
+    
+    def resolve_groups(self, usernames: List[str], nested: bool = True) -> Dict[str, Optional[List[str]]]:
+        """Grupos de varios usuarios, resueltos en paralelo.
+        
+        Los usuarios se buscan con la consulta OR por lotes de
+        ``get_users_by_usernames``. Los grupos anidados de los que no están
+        en cache se reparten en como mucho ``pool_size`` lotes, cada uno con
+        su propia conexión del pool, que se ejecutan en el executor del
+        servicio (ver ``_run_concurrently``). Con el método "bfs" los grupos
+        ya consultados se comparten entre todos los usuarios de la llamada.
+        Los usuarios que no existen quedan con None.
+        """
+        unique = list(dict.fromkeys(u.strip() for u in usernames if u and u.strip()))
+        if not unique:
+            return {}
+        
+        users = self.get_users_by_usernames(unique)
+        if not nested:
+            return {
+                username: (user.get('groups', []) if user is not None else None)
+                for username, user in users.items()
+            }
+        
+        results: Dict[str, Optional[List[str]]] = {}
+        pending: List[Tuple[str, Dict]] = []
+        for username, user in users.items():
+            if user is None:
+                results[username] = None
+                continue
+            cached = self._result_cache.get(self._effective_groups_key(user))
+            if cached is not None:
+                results[username] = list(cached)
+            else:
+                pending.append((username, user))
+        
+        if pending:
+            # Grupo (DN en minúsculas) -> DNs de sus grupos padre
+            group_cache: Dict[str, List[str]] = {}
+            lanes = max(1, min(self.pool_size, len(pending)))
+            chunks = [pending[lane::lanes] for lane in range(lanes)]
             
-            groups = []
-            user_entry = conn.entries[0]
+            def resolve_chunk(chunk: List[Tuple[str, Dict]]) -> List[List[str]]:
+                return self._with_connection(
+                    lambda conn: [self._nested_groups(conn, user, group_cache) for _, user in chunk]
+                )
             
-            if hasattr(user_entry, 'memberOf') and user_entry.memberOf:
-                for group_dn in user_entry.memberOf:
-                    group_name = str(group_dn).split(',')[0].replace('CN=', '')
-                    groups.append(group_name)
+            for chunk, (resolved, error) in zip(chunks, self._run_concurrently(resolve_chunk, chunks)):
+                if error is not None:
+                    if not isinstance(error, BACKEND_FAILURES + (CircuitOpenError,)):
+                        raise error
+                    for username, user in chunk:
+                        results[username] = self._stale_or_raise(
+                            self._effective_groups_key(user), error, reraise=True
+                        )
+                    continue
+                for (username, user), groups in zip(chunk, resolved):
+                    self._result_cache.set(self._effective_groups_key(user), list(groups))
+                    results[username] = groups
+        
+        return {username: results[username] for username in unique}
+    
+    def _run_concurrently(self, func: Callable[[Any], T], items: List[Any]) -> List[Tuple[Optional[T], Optional[Exception]]]:
+        """``func`` sobre cada elemento, en paralelo en el executor del servicio.
+        
+        El primero se ejecuta en el hilo que llama y el resto se envía al
+        executor; los que el executor aún no ha empezado se recuperan y se
+        ejecutan también aquí. Así una llamada que ya corre en el executor
+        (desde ``run_async``) no se queda esperando a hilos ocupados y el
+        paralelismo sigue acotado por AD_ASYNC_WORKERS. Devuelve
+        ``(resultado, error)`` por elemento, en el mismo orden.
+        """
+        def outcome(item):
+            try:
+                return func(item), None
+            except Exception as e:
+                return None, e
+        
+        futures = [self._executor.submit(func, item) for item in items[1:]]
+        outcomes = [outcome(items[0])]
+        for future, item in zip(futures, items[1:]):
+            if future.cancel():
+                outcomes.append(outcome(item))
+                continue
+            try:
+                outcomes.append((future.result(), None))
+            except Exception as e:
+                outcomes.append((None, e))
+        return outcomes
+    
+    @staticmethod
+    def _effective_groups_key(user: Dict) -> Tuple:
+        return ("effective_groups", user['username'].lower())
+    
+    def _nested_groups(self, conn: Connection, user: Dict, group_cache: Dict[str, List[str]]) -> List[str]:
+        if self.group_resolution == "bfs":
+            return self._nested_groups_bfs(conn, user['dn'], group_cache)
+        return self._nested_groups_in_chain(conn, user['dn'])
+    
+    def _nested_groups_in_chain(self, conn: Connection, user_dn: str) -> List[str]:
+        """Todos los grupos del usuario en una sola búsqueda (regla IN_CHAIN de AD)"""
+        search_filter = (
+            f"(&(objectClass=group)"
+            f"(member:{MATCHING_RULE_IN_CHAIN}:={escape_filter_chars(user_dn)}))"
+        )
+        
+        entries = conn.extend.standard.paged_search(
+            search_base=self.base_dn,
+            search_filter=search_filter,
+            search_scope=SUBTREE,
+            attributes=['cn'],
+            paged_size=self.page_size,
+            generator=True
+        )
+        
+        return sorted(
+            self._cn_from_dn(entry['dn'])
+            for entry in entries
+            if entry.get('type') == 'searchResEntry'
+        )
+    
+    def _nested_groups_bfs(self, conn: Connection, user_dn: str, group_cache: Dict[str, List[str]]) -> List[str]:
+        """Recorrido por niveles de memberOf, una consulta por lote de grupos"""
+        conn.search(
+            search_base=user_dn,
+            search_filter='(objectClass=*)',
+            search_scope=BASE,
+            attributes=['memberOf']
+        )
+        if not conn.entries or 'memberOf' not in conn.entries[0]:
+            return []
+        
+        seen: Dict[str, str] = {}
+        frontier = [str(dn) for dn in conn.entries[0].memberOf]
+        
+        while frontier:
+            for dn in frontier:
+                seen[dn.lower()] = dn
             
-            return groups
+            missing = [dn for dn in frontier if dn.lower() not in group_cache]
+            for start in range(0, len(missing), GROUP_BFS_BATCH_SIZE):
+                batch = missing[start:start + GROUP_BFS_BATCH_SIZE]
+                conditions = ''.join(f"(distinguishedName={escape_filter_chars(dn)})" for dn in batch)
+                conn.search(
+                    search_base=self.base_dn,
+                    search_filter=f"(&(objectClass=group)(|{conditions}))",
+                    search_scope=SUBTREE,
+                    attributes=['memberOf']
+                )
+                for dn in batch:
+                    group_cache.setdefault(dn.lower(), [])
+                for entry in conn.entries:
+                    parents = [str(parent) for parent in entry.memberOf] if 'memberOf' in entry else []
+                    group_cache[entry.entry_dn.lower()] = parents
             
-        except Exception as e:
-            self.logger.error(f"Error getting user groups: {str(e)}")
+            next_frontier = {}
+            for dn in frontier:
+                for parent in group_cache.get(dn.lower(), []):
+                    if parent.lower() not in seen:
+                        next_frontier[parent.lower()] = parent
+            frontier = list(next_frontier.values())
+        
+        return sorted(self._cn_from_dn(dn) for dn in seen.values())
+    
+    def _stale_or_raise(self, cache_key, error: Exception, default=None, reraise: bool = False):
+        """Resultado caducado de la cache cuando AD no está disponible.
+        
+        Sin copia antigua: con el circuito abierto (o ``reraise``) se
+        propaga el error para que el llamante falle rápido; en otro caso se
+        devuelve ``default`` como hasta ahora.
+        """
+        stale = self._result_cache.get_stale(cache_key)
+        if stale is not None:
+            self.logger.warning(f"Serving stale AD cache entry {cache_key[0]!r}: {error}")
+            return copy.deepcopy(stale)
+        
+        if reraise or isinstance(error, CircuitOpenError):
+            raise error
+        return default
+    
+    def breaker_status(self) -> Dict:
+        return self._breaker.stats()
+    
+    def invalidate_cache(self, username: Optional[str] = None) -> int:
+        """Vaciar la cache de resultados, o solo lo relativo a un usuario.
+        
+        Las búsquedas cacheadas pueden incluir al usuario, así que también
+        se descartan. Devuelve el número de entradas eliminadas.
+        """
+        if not username:
+            return self._result_cache.clear()
+        
+        username = username.strip().lower()
+        return self._result_cache.invalidate_where(
+            lambda key: key[0] == "search" or key[1] == username
+        )
+    
+    def cache_stats(self) -> Dict:
+        return self._result_cache.stats()
+    
+    def _get_user_groups(self, conn: Connection, username: str) -> List[str]:
+        """Grupos directos (memberOf) de un usuario sobre una conexión del pool"""
+        safe_attrs = self._get_safe_attributes(conn)
+        
+        conn.search(
+            search_base=self.user_search_base,
+            search_filter=self._exact_user_filter(username, safe_attrs),
+            attributes=['memberOf'] if 'memberOf' in safe_attrs else []
+        )
+        
+        if not conn.entries:
             return []
         
-        finally:
-            conn.unbind()
+        return self._group_names(conn.entries[0])
     
     def test_connection(self) -> Dict:
         """Probar la conexión a Active Directory"""
@@ -476,28 +1244,28 @@ class ActiveDirectoryService:
                     "details": config_status
                 }
             
-            # Intentar conexión
-            conn = self._get_connection()
-            if conn:
-                # Descubrir atributos
-                available_attrs = self._discover_available_attributes(conn)
-                conn.unbind()
-                
-                available_count = sum(1 for avail in available_attrs.values() if avail)
-                
-                return {
-                    "success": True,
-                    "message": f"Connection successful using: {self._successful_credential_format}",
-                    "working_credential": self._successful_credential_format,
-                    "available_attributes": available_count,
-                    "config": config_status
-                }
-            else:
+            # Intentar conexión (descubriendo atributos)
+            try:
+                available_attrs = self._with_connection(self._discover_available_attributes)
+            except Exception as e:
+                self.logger.error(f"Error connecting to AD: {str(e)}")
                 return {
                     "success": False,
                     "error": "Could not establish connection",
                     "config": config_status
                 }
+            
+            available_count = sum(1 for avail in available_attrs.values() if avail)
+            
+            return {
+                "success": True,
+                "message": f"Connection successful using: {self._successful_credential_format}",
+                "working_credential": self._successful_credential_format,
+                "available_attributes": available_count,
+                "pool": self._pool.stats(),
+                "result_cache": self._result_cache.stats(),
+                "config": config_status
+            }
                 
         except Exception as e:
             return {
@@ -517,10 +1285,12 @@ class ActiveDirectoryService:
                 "use_ssl": self.use_ssl,
                 "base_dn": self.base_dn,
                 "bind_user": self.bind_user,
-                "user_search_base": self.user_search_base
+                "user_search_base": self.user_search_base,
+                "circuit_breaker": self._breaker.stats()
             }
         except ValueError as e:
             return {
                 "status": "invalid",
-                "error": str(e)
+                "error": str(e),
+                "circuit_breaker": self._breaker.stats()
             }
\ No newline at end of file
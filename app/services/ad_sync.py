@@ -0,0 +1,244 @@
+# app/services/ad_sync.py - Copia local del directorio de Active Directory
+
+from datetime import datetime, timezone
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from typing import Dict, Iterable, List, Optional
+import logging
+import os
+import threading
+import zlib
+
+from models import models
+from models.database import SessionLocal
+from .ad_service import ActiveDirectoryService
+
+# Columnas de ad_users que se rellenan con los datos de cada usuario
+MIRROR_COLUMNS = [
+    'username', 'display_name', 'first_name', 'last_name', 'email',
+    'department', 'title', 'phone', 'mobile', 'office', 'company',
+    'manager', 'employee_id', 'created_date', 'last_logon'
+]
+
+DATETIME_COLUMNS = ('created_date', 'last_logon', 'when_changed')
+
+# Insert con ON CONFLICT de cada dialecto soportado
+DIALECT_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+def _naive_utc(value) -> Optional[datetime]:
+    """Las columnas DateTime del proyecto guardan UTC sin zona horaria"""
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    # lastLogon = 0 llega como 1601-01-01 (nunca ha iniciado sesión)
+    if value.year <= 1601:
+        return None
+    return value
+
+
+class ADDirectorySync:
+    """Sincroniza los usuarios de AD en la tabla ad_users.
+
+    La primera ejecución (o una con ``full=True``) copia el directorio
+    completo y elimina las filas que ya no existen en AD. Las siguientes
+    solo piden a AD los objetos con uSNChanged mayor que el
+    highestCommittedUSN guardado en la anterior, de modo que las búsquedas
+    de la aplicación se resuelven en la base local y AD solo transfiere los
+    cambios.
+
+    Los USN son propios de cada controlador de dominio: el estado se guarda
+    por servidor configurado y base de búsqueda junto con la identidad del
+    DC que respondió (``dc_key``); si el nombre configurado resuelve a otro
+    DC se hace una sincronización completa. Las bajas no aparecen en una
+    sincronización incremental; se eliminan en la siguiente completa.
+
+    Con varios workers cada uno lanza su sincronización periódica; en
+    PostgreSQL un advisory lock de la transacción hace que solo una se
+    ejecute a la vez y las demás terminan sin tocar AD.
+    """
+
+    def __init__(
+        self,
+        ad_service: ActiveDirectoryService,
+        session_factory=SessionLocal,
+        batch_size: Optional[int] = None,
+        logger: Optional[logging.Logger] = None
+    ):
+        self.ad_service = ad_service
+        self.session_factory = session_factory
+        self.batch_size = batch_size or int(os.getenv("AD_SYNC_BATCH_SIZE", 500))
+        self.logger = logger or logging.getLogger(__name__)
+        # Una sola sincronización a la vez por proceso
+        self._lock = threading.Lock()
+
+    @property
+    def server_key(self) -> str:
+        service = self.ad_service
+        return f"{service.server_host}:{service.server_port}|{service.user_search_base}"
+
+    def get_state(self, db: Session) -> Optional[models.DirectorySyncState]:
+        query = select(models.DirectorySyncState).where(
+            models.DirectorySyncState.server_key == self.server_key
+        )
+        return db.scalars(query).first()
+
+    def run(self, full: bool = False) -> Dict:
+        """Ejecutar una sincronización y devolver un resumen"""
+        if not self._lock.acquire(blocking=False):
+            return {"success": False, "error": "A directory sync is already running"}
+
+        try:
+            return self._run(full)
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def dc_key(dc_info: Dict) -> Optional[str]:
+        """Identidad del controlador de dominio (dnsHostName|invocationId)"""
+        if not dc_info.get("dns_host_name") and not dc_info.get("invocation_id"):
+            return None
+        return f"{dc_info.get('dns_host_name') or ''}|{dc_info.get('invocation_id') or ''}"
+
+    def _run(self, full: bool) -> Dict:
+        started = datetime.utcnow()
+
+        with self.session_factory() as db:
+            if not self._try_lock(db):
+                return {"success": False, "error": "A directory sync is already running in another worker"}
+
+            with self.ad_service.sync_connection() as conn:
+                summary = self._sync(db, conn, full, started)
+
+        self.logger.info(f"AD sync finished: {summary}")
+        return summary
+
+    def _try_lock(self, db: Session) -> bool:
+        """Advisory lock de PostgreSQL para esta sincronización.
+
+        Es de transacción (se libera con el commit o el rollback de la
+        sincronización, que va entera en una transacción), por lo que
+        también funciona detrás de PgBouncer en modo transacción.
+        """
+        if db.get_bind().dialect.name != "postgresql":
+            return True
+        lock_id = zlib.crc32(f"ad_sync|{self.server_key}".encode())
+        return bool(db.scalar(select(func.pg_try_advisory_xact_lock(lock_id))))
+
+    def _sync(self, db: Session, conn, full: bool, started: datetime) -> Dict:
+        state = self.get_state(db)
+        if state is None:
+            state = models.DirectorySyncState(server_key=self.server_key, users_count=0)
+            db.add(state)
+
+        # Leer la marca de agua antes de buscar y en la misma conexión:
+        # lo que cambie durante la búsqueda se vuelve a pedir en la
+        # siguiente ejecución, y el USN es del mismo DC que responde
+        dc_info = self.ad_service.read_dc_info(conn)
+        highest_usn = dc_info["highest_usn"]
+        dc_key = self.dc_key(dc_info)
+
+        if state.highest_usn is not None and dc_key != state.dc_key:
+            # Los USN de otro DC (o de este tras una restauración) no
+            # son comparables: solo una sincronización completa es segura
+            self.logger.warning(
+                f"Domain controller changed ({state.dc_key} -> {dc_key}); running a full AD sync"
+            )
+            full = True
+
+        full = full or state.highest_usn is None or dc_key is None
+        since_usn = None if full else state.highest_usn
+
+        self.logger.info(
+            f"Starting {'full' if full else 'incremental'} AD sync against {dc_key} "
+            f"(since uSNChanged {since_usn}, highestCommittedUSN {highest_usn})"
+        )
+
+        batch: List[Dict] = []
+        synced = 0
+        max_seen_usn = since_usn or 0
+
+        for user in self.ad_service.iter_changed_users(conn, since_usn):
+            row = self._to_row(user, started)
+            max_seen_usn = max(max_seen_usn, row['usn_changed'] or 0)
+            batch.append(row)
+
+            if len(batch) >= self.batch_size:
+                self._upsert(db, batch)
+                synced += len(batch)
+                batch = []
+
+        if batch:
+            self._upsert(db, batch)
+            synced += len(batch)
+
+        removed = 0
+        if full:
+            # Solo se llega aquí si el recorrido terminó: si AD corta la
+            # búsqueda (límite de tamaño o de tiempo) _iter_users lanza
+            # ADSearchIncompleteError y no se borra nada. Todo lo que
+            # sigue en AD se acaba de tocar; el resto son bajas
+            result = db.execute(
+                delete(models.DirectoryUser).where(models.DirectoryUser.synced_at < started)
+            )
+            removed = result.rowcount or 0
+            state.last_full_sync = started
+
+        state.highest_usn = highest_usn if highest_usn is not None else max_seen_usn
+        state.dc_key = dc_key
+        state.last_sync = started
+        state.users_count = db.scalar(select(func.count()).select_from(models.DirectoryUser))
+        db.commit()
+
+        return {
+            "success": True,
+            "mode": "full" if full else "incremental",
+            "domain_controller": dc_key,
+            "since_usn": since_usn,
+            "highest_usn": state.highest_usn,
+            "synced": synced,
+            "removed": removed,
+            "users_count": state.users_count,
+            "duration_seconds": round((datetime.utcnow() - started).total_seconds(), 3)
+        }
+
+    @staticmethod
+    def _to_row(user: Dict, synced_at: datetime) -> Dict:
+        row = {column: user.get(column) or None for column in MIRROR_COLUMNS}
+        row['dn'] = user['dn']
+        row['usn_changed'] = int(user['uSNChanged']) if user.get('uSNChanged') is not None else None
+        row['when_changed'] = user.get('whenChanged')
+        row['synced_at'] = synced_at
+
+        for column in DATETIME_COLUMNS:
+            row[column] = _naive_utc(row[column])
+
+        return row
+
+    def _upsert(self, db: Session, rows: Iterable[Dict]):
+        """INSERT ... ON CONFLICT (dn) DO UPDATE de un lote de usuarios"""
+        dialect = db.get_bind().dialect.name
+        insert = DIALECT_INSERTS.get(dialect)
+        if insert is None:
+            raise ValueError(f"Directory sync does not support the '{dialect}' dialect")
+
+        statement = insert(models.DirectoryUser).values(list(rows))
+        updated_columns = {
+            column: statement.excluded[column]
+            for column in MIRROR_COLUMNS + ['usn_changed', 'when_changed', 'synced_at']
+        }
+        db.execute(statement.on_conflict_do_update(index_elements=['dn'], set_=updated_columns))
+        db.flush()
+
+
+if __name__ == "__main__":
+    # python -m services.ad_sync [--full]  (desde el directorio app/)
+    import sys
+
+    sync = ADDirectorySync(ActiveDirectoryService())
+    print(sync.run(full="--full" in sys.argv[1:]))
@@ -0,0 +1,121 @@
+# app/services/circuit_breaker.py - Corte rápido cuando un backend no responde
+
+from typing import Dict, Optional
+import logging
+import threading
+import time
+
+
+class CircuitOpenError(Exception):
+    """El circuito está abierto: la llamada se rechaza sin intentarla"""
+
+    def __init__(self, name: str, retry_in: float):
+        self.retry_in = retry_in
+        super().__init__(f"{name} unavailable, retrying in {retry_in:.0f}s (circuit open)")
+
+
+class CircuitBreaker:
+    """Circuit breaker clásico de tres estados.
+
+    - closed: las llamadas pasan; ``failure_threshold`` fallos seguidos lo abren.
+    - open: las llamadas fallan al momento con CircuitOpenError durante
+      ``reset_timeout`` segundos.
+    - half_open: pasado ese tiempo se deja pasar una única llamada de prueba;
+      si va bien se cierra y si falla se vuelve a abrir.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30,
+        logger: Optional[logging.Logger] = None
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_progress = False
+
+        # Contadores
+        self._rejected = 0
+        self._times_opened = 0
+        self._last_error: Optional[str] = None
+
+    def before_call(self):
+        """Comprobar si se puede intentar la llamada (lanza CircuitOpenError si no)"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+
+            if self._state == self.OPEN:
+                remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+                if remaining > 0:
+                    self._rejected += 1
+                    raise CircuitOpenError(self.name, remaining)
+                self._state = self.HALF_OPEN
+                self._trial_in_progress = False
+
+            # half_open: una sola llamada de prueba a la vez
+            if self._trial_in_progress:
+                self._rejected += 1
+                raise CircuitOpenError(self.name, 0)
+            self._trial_in_progress = True
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                self.logger.info(f"Circuit '{self.name}' closed again")
+            self._state = self.CLOSED
+            self._consecutive_failures = 0
+            self._trial_in_progress = False
+
+    def record_failure(self, error: Optional[BaseException] = None):
+        with self._lock:
+            self._consecutive_failures += 1
+            self._trial_in_progress = False
+            if error is not None:
+                self._last_error = str(error)
+
+            if self._state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self._times_opened += 1
+                    self.logger.warning(
+                        f"Circuit '{self.name}' opened after {self._consecutive_failures} "
+                        f"consecutive failures; failing fast for {self.reset_timeout}s"
+                    )
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def stats(self) -> Dict:
+        state = self.state
+        with self._lock:
+            retry_in = 0.0
+            if self._state == self.OPEN:
+                retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+            return {
+                "state": state,
+                "consecutive_failures": self._consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout_seconds": self.reset_timeout,
+                "retry_in_seconds": round(retry_in, 1),
+                "times_opened": self._times_opened,
+                "rejected_calls": self._rejected,
+                "last_error": self._last_error
+            }
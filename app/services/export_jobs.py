@@ -0,0 +1,422 @@
+# app/services/export_jobs.py - Exportaciones en segundo plano con fichero descargable
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+from . import export_sources
+from .export_service import (
+    ExportService, EXPORT_FORMATS, STREAMING_FORMATS, COLUMNAR_FORMATS, ARROW_AVAILABLE
+)
+
+# Origen de cada exportación -> prefijo del fichero descargado
+EXPORT_JOB_SOURCES = {
+    "users": "usuarios_local",
+    "ad_users": "usuarios_ad",
+    "items": "inventario",
+    "assignments": "asignaciones"
+}
+
+# Cada cuántos segundos el worker vuelca el progreso al manifiesto
+PROGRESS_INTERVAL = 1.0
+MANIFEST_SUFFIX = ".json"
+
+
+class ExportJobCancelled(Exception):
+    """El gestor se cerró con el trabajo aún en curso"""
+
+
+class ExportJob:
+    """Estado de una exportación en segundo plano.
+    
+    Se guarda como manifiesto JSON junto al fichero para que cualquier
+    proceso que comparta el directorio pueda consultarlo. Las marcas de
+    tiempo son de reloj de pared (``time.time()``) por el mismo motivo.
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, source: str, format: str, params: Dict, key: str):
+        self.id = uuid.uuid4().hex
+        self.source = source
+        self.format = format
+        self.params = params
+        self.key = key
+        self.status = self.PENDING
+        self.error: Optional[str] = None
+
+        media_type, extension = EXPORT_FORMATS[format]
+        self.media_type = media_type
+        self.filename = f"{EXPORT_JOB_SOURCES[source]}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+        self.path: Optional[str] = None
+        self.size_bytes: Optional[int] = None
+
+        # Progreso (el worker los actualiza, las peticiones solo los leen)
+        self.rows_processed = 0
+        self.total_rows: Optional[int] = None
+
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.updated_at = self.created_at
+        self.expires_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (self.DONE, self.FAILED)
+
+    def expired(self, now: Optional[float] = None) -> bool:
+        return self.expires_at is not None and (now or time.time()) >= self.expires_at
+
+    def to_manifest(self) -> Dict:
+        return dict(vars(self))
+
+    @classmethod
+    def from_manifest(cls, data: Dict) -> "ExportJob":
+        job = cls.__new__(cls)
+        job.__dict__.update(data)
+        return job
+
+    def to_dict(self) -> Dict:
+        rows_per_second = None
+        eta_seconds = None
+        progress = None
+
+        if self.started_at:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+            if elapsed > 0 and self.rows_processed:
+                rows_per_second = round(self.rows_processed / elapsed, 1)
+
+        if self.status == self.DONE:
+            progress, eta_seconds = 1.0, 0
+        elif self.total_rows:
+            progress = round(min(self.rows_processed / self.total_rows, 1.0), 3)
+            if rows_per_second:
+                eta_seconds = round(max(self.total_rows - self.rows_processed, 0) / rows_per_second, 1)
+
+        return {
+            "id": self.id,
+            "source": self.source,
+            "format": self.format,
+            "params": self.params,
+            "status": self.status,
+            "rows_processed": self.rows_processed,
+            "total_rows": self.total_rows,
+            "progress": progress,
+            "rows_per_second": rows_per_second,
+            "eta_seconds": eta_seconds,
+            "created_at": _isoformat(self.created_at),
+            "started_at": _isoformat(self.started_at),
+            "finished_at": _isoformat(self.finished_at),
+            "expires_in_seconds": (
+                round(max(self.expires_at - time.time(), 0)) if self.expires_at is not None else None
+            ),
+            "filename": self.filename,
+            "size_bytes": self.size_bytes,
+            "error": self.error
+        }
+
+
+def _isoformat(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.utcfromtimestamp(timestamp).isoformat() if timestamp else None
+
+
+class ExportJobManager:
+    """Ejecuta exportaciones en un pool de hilos y guarda el resultado en disco.
+
+    Cada trabajo escribe con ``ExportService`` en un fichero de ``directory``
+    mientras cuenta las filas procesadas; para las fuentes de la base local
+    se cuenta antes el total, lo que permite estimar el tiempo restante.
+
+    El estado de cada trabajo se guarda en un manifiesto JSON en el mismo
+    directorio, de modo que con varios workers (``EXPORT_JOB_DIR`` en un
+    volumen compartido) cualquiera de ellos responde al estado y a la
+    descarga, no solo el que lo ejecuta.
+
+    El fichero terminado se conserva ``ttl`` segundos. Mientras tanto, una
+    petición con los mismos parámetros (o una que llega con el trabajo aún
+    en curso) devuelve el mismo trabajo en lugar de repetir la exportación.
+    """
+
+    def __init__(
+        self,
+        ad_service=None,
+        export_service: Optional[ExportService] = None,
+        workers: Optional[int] = None,
+        ttl: Optional[float] = None,
+        directory: Optional[str] = None,
+        logger: Optional[logging.Logger] = None
+    ):
+        self.ad_service = ad_service
+        self.export_service = export_service or ExportService()
+        self.workers = workers or int(os.getenv("EXPORT_JOB_WORKERS", 2))
+        self.ttl = ttl if ttl is not None else float(os.getenv("EXPORT_JOB_TTL", 900))
+        self.directory = directory or os.getenv(
+            "EXPORT_JOB_DIR", os.path.join(tempfile.gettempdir(), "inventario_exports")
+        )
+        self.logger = logger or logging.getLogger(__name__)
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="export-job")
+        self._lock = threading.Lock()
+        # Trabajos que ejecuta este proceso y descargas abiertas por trabajo
+        self._own: Dict[str, ExportJob] = {}
+        self._downloads: Counter = Counter()
+        self._closed = False
+
+    def submit(
+        self,
+        source: str,
+        format: str,
+        search_term: str = "",
+        include_groups: bool = False,
+        active_only: bool = False
+    ) -> Tuple[ExportJob, bool]:
+        """Crear (o reutilizar) un trabajo. Devuelve ``(job, reused)``"""
+        if source not in EXPORT_JOB_SOURCES:
+            raise ValueError(f"Unsupported export source: {source}")
+        if format not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format: {format}")
+        if format in COLUMNAR_FORMATS and not ARROW_AVAILABLE:
+            raise ValueError("pyarrow is not installed")
+        if source == "ad_users" and self.ad_service is None:
+            raise ValueError("Active Directory service not available")
+
+        params = self._params(source, search_term, include_groups, active_only)
+        key = json.dumps([source, format, params], sort_keys=True)
+
+        self.purge_expired()
+        with self._lock:
+            for job in self._load_all():
+                if job.key == key and job.status != ExportJob.FAILED:
+                    return job, True
+
+            job = ExportJob(source, format, params, key)
+            self._own[job.id] = job
+            self._save(job)
+
+        self._executor.submit(self._run, job)
+        return job, False
+
+    def get(self, job_id: str) -> Optional[ExportJob]:
+        self.purge_expired()
+        return self._load(job_id)
+
+    def list_jobs(self) -> List[ExportJob]:
+        self.purge_expired()
+        return sorted(self._load_all(), key=lambda job: job.created_at, reverse=True)
+
+    def open_result(self, job_id: str) -> Optional[Tuple[ExportJob, BinaryIO]]:
+        """Abrir el fichero de un trabajo terminado para descargarlo.
+
+        La descarga queda registrada hasta que ``iter_result`` cierra el
+        fichero, y ``purge_expired`` no borra los trabajos con descargas
+        abiertas en este proceso. En otro proceso el borrado tampoco corta
+        la descarga: el fichero ya abierto sigue siendo legible (y en
+        Windows el borrado falla y se reintenta en la siguiente purga).
+        """
+        with self._lock:
+            job = self._load(job_id)
+            if job is None or job.status != ExportJob.DONE or not job.path:
+                return None
+            try:
+                handle = open(job.path, "rb")
+            except FileNotFoundError:
+                return None
+            self._downloads[job.id] += 1
+        return job, handle
+
+    def iter_result(self, job: ExportJob, handle: BinaryIO) -> Iterator[bytes]:
+        """Enviar el fichero abierto con ``open_result`` y liberar la descarga"""
+        try:
+            yield from self.export_service.iter_file(handle)
+        finally:
+            with self._lock:
+                self._downloads[job.id] -= 1
+                if self._downloads[job.id] <= 0:
+                    del self._downloads[job.id]
+
+    def purge_expired(self) -> int:
+        """Eliminar los trabajos caducados (o abandonados) y sus ficheros.
+
+        Un trabajo sin terminar cuyo manifiesto lleva ``ttl`` segundos sin
+        actualizarse se da por abandonado (el proceso que lo ejecutaba
+        terminó sin limpiarlo).
+        """
+        now = time.time()
+        purged = 0
+        with self._lock:
+            for job in self._load_all():
+                abandoned = not job.finished and job.id not in self._own and now - job.updated_at >= self.ttl
+                if not (job.expired(now) or abandoned) or self._downloads[job.id]:
+                    continue
+                # El manifiesto solo se borra si el fichero ya no está, para
+                # reintentar en la siguiente purga si el borrado falla
+                if self._remove_file(job):
+                    self._remove_manifest(job)
+                    purged += 1
+        return purged
+
+    def close(self):
+        """Cancelar los trabajos de este proceso y borrar los que no terminaron"""
+        with self._lock:
+            self._closed = True
+            unfinished = [job for job in self._own.values() if not job.finished]
+            self._own.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+        for job in unfinished:
+            self._remove_file(job)
+            self._remove_manifest(job)
+
+    @staticmethod
+    def _params(source: str, search_term: str, include_groups: bool, active_only: bool) -> Dict:
+        # Solo los parámetros que afectan a cada origen forman parte de la clave
+        if source == "users":
+            return {"search_term": (search_term or "").strip()}
+        if source == "ad_users":
+            return {"search_term": (search_term or "").strip(), "include_groups": bool(include_groups)}
+        if source == "assignments":
+            return {"active_only": bool(active_only)}
+        return {}
+
+    def _rows(self, job: ExportJob) -> Tuple[Iterable[Dict], Dict[str, str]]:
+        params = job.params
+        if job.source == "users":
+            search = params["search_term"] or None
+            job.total_rows = export_sources.count_local_users(search)
+            return export_sources.iter_local_users(search), export_sources.LOCAL_USER_COLUMNS
+        if job.source == "items":
+            job.total_rows = export_sources.count_items()
+            return export_sources.iter_items(), export_sources.ITEM_COLUMNS
+        if job.source == "assignments":
+            job.total_rows = export_sources.count_assignments(params["active_only"])
+            return (
+                export_sources.iter_assignments(active_only=params["active_only"]),
+                export_sources.ASSIGNMENT_COLUMNS
+            )
+        # En AD el total no se conoce hasta terminar la búsqueda paginada
+        rows = export_sources.iter_ad_users(self.ad_service, params["search_term"], params["include_groups"])
+        return rows, export_sources.ad_user_columns(params["include_groups"])
+
+    def _counting(self, job: ExportJob, rows: Iterable[Dict]) -> Iterator[Dict]:
+        last_saved = time.monotonic()
+        for row in rows:
+            if self._closed:
+                raise ExportJobCancelled("Export job manager closed")
+            job.rows_processed += 1
+            if time.monotonic() - last_saved >= PROGRESS_INTERVAL:
+                self._save(job)
+                last_saved = time.monotonic()
+            yield row
+
+    def _write(self, job: ExportJob, rows: Iterable[Dict], columns: Dict[str, str], sink):
+        if job.format in STREAMING_FORMATS:
+            for chunk in self.export_service.stream(job.format, rows):
+                sink.write(chunk)
+        elif job.format in COLUMNAR_FORMATS:
+            self.export_service.write_columnar(job.format, rows, sink, columns)
+        else:
+            workbook = self.export_service.export_to_excel(rows, job.filename)
+            shutil.copyfileobj(workbook, sink)
+
+    def _run(self, job: ExportJob):
+        job.status = ExportJob.RUNNING
+        job.started_at = time.time()
+        self._save(job)
+
+        try:
+            rows, columns = self._rows(job)
+            fd, job.path = tempfile.mkstemp(
+                prefix=f"{job.id}_", suffix=os.path.splitext(job.filename)[1], dir=self.directory
+            )
+            with os.fdopen(fd, "wb") as sink:
+                self._write(job, self._counting(job, rows), columns, sink)
+
+            job.size_bytes = os.path.getsize(job.path)
+            job.status = ExportJob.DONE
+            self.logger.info(
+                f"Export job {job.id} ({job.source}, {job.format}) finished: "
+                f"{job.rows_processed} rows, {job.size_bytes} bytes"
+            )
+        except Exception as e:
+            self.logger.error(f"Export job {job.id} ({job.source}, {job.format}) failed: {e}")
+            job.error = str(e)
+            job.status = ExportJob.FAILED
+            self._remove_file(job)
+        finally:
+            job.finished_at = time.time()
+            job.expires_at = job.finished_at + self.ttl
+            self._save(job)
+            with self._lock:
+                self._own.pop(job.id, None)
+
+    # Manifiestos
+
+    def _manifest_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}{MANIFEST_SUFFIX}")
+
+    def _save(self, job: ExportJob):
+        """Escribir el manifiesto de forma atómica (fichero temporal + replace)"""
+        if self._closed:
+            return
+        job.updated_at = time.time()
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{job.id}_", suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(job.to_manifest(), f)
+            os.replace(tmp_path, self._manifest_path(job.id))
+        except OSError as e:
+            self.logger.warning(f"Could not save export job manifest {job.id}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def _load(self, job_id: str) -> Optional[ExportJob]:
+        # El id llega de la URL: solo se aceptan ids generados por uuid4().hex
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._manifest_path(job_id), encoding="utf-8") as f:
+                return ExportJob.from_manifest(json.load(f))
+        except (OSError, ValueError):
+            return None
+
+    def _load_all(self) -> List[ExportJob]:
+        jobs = []
+        for name in os.listdir(self.directory):
+            if name.endswith(MANIFEST_SUFFIX):
+                job = self._load(name[:-len(MANIFEST_SUFFIX)])
+                if job is not None:
+                    jobs.append(job)
+        return jobs
+
+    def _remove_manifest(self, job: ExportJob):
+        try:
+            os.remove(self._manifest_path(job.id))
+        except OSError:
+            pass
+
+    @staticmethod
+    def _remove_file(job: ExportJob) -> bool:
+        """Borrar el fichero del trabajo; False si sigue en disco"""
+        if job.path and os.path.exists(job.path):
+            try:
+                os.remove(job.path)
+            except OSError:
+                return False
+        job.path = None
+        return True
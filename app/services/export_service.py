@@ -1,51 +1,129 @@
 # app/services/export_service.py
 import pandas as pd
-from io import BytesIO
-from typing import List, Dict
+from io import BytesIO, StringIO
+from itertools import chain, islice
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+from typing import BinaryIO, Iterable, Iterator, List, Dict, Optional
+import csv
 import json
-from datetime import datetime
+import tempfile
+from datetime import date, datetime, timezone
+
+# pyarrow es opcional: sin él no hay exportación a Parquet/Arrow
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    ARROW_AVAILABLE = True
+except ImportError:
+    pa = pq = None
+    ARROW_AVAILABLE = False
+
+# Filas por bloque enviado al cliente en las exportaciones en streaming
+STREAM_CHUNK_ROWS = 500
+
+# Filas usadas para calcular el ancho de las columnas en Excel
+EXCEL_WIDTH_SAMPLE_ROWS = 1000
+
+# Tipo MIME y extensión de cada formato de exportación
+EXPORT_FORMATS = {
+    "excel": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+    "csv": ("text/csv", "csv"),
+    "json": ("application/json", "json"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.file", "arrow")
+}
+
+# Formatos que se generan en streaming, sin materializar el resultado
+STREAMING_FORMATS = ("csv", "json", "ndjson")
+
+# Formatos columnares (pyarrow): se escriben por lotes a un fichero temporal
+COLUMNAR_FORMATS = ("parquet", "arrow")
+
+# Filas por lote (row group en Parquet, record batch en Arrow)
+COLUMNAR_BATCH_ROWS = 50000
+
+# Hasta este tamaño el fichero temporal se queda en memoria
+COLUMNAR_SPOOL_BYTES = 16 * 1024 * 1024
+
+# Bloque de lectura al enviar un fichero generado
+FILE_CHUNK_BYTES = 64 * 1024
 
 class ExportService:
     
     @staticmethod
-    def export_to_excel(data: List[Dict], filename: str = None) -> BytesIO:
-        """Exportar datos a Excel"""
+    def _excel_value(value):
+        if value is None or isinstance(value, (str, int, float, bool)):
+            return value
+        if isinstance(value, datetime):
+            # Excel no admite zona horaria: se guarda en UTC
+            if value.tzinfo is not None:
+                value = value.astimezone(timezone.utc).replace(tzinfo=None)
+            return value
+        if isinstance(value, date):
+            return value
+        if isinstance(value, list):
+            return "; ".join(str(v) for v in value)
+        return str(value)
+    
+    @staticmethod
+    def _column_widths(sample: List[List], columns: List[str]) -> List[float]:
+        """Ancho de cada columna a partir de la longitud máxima del texto (vectorizado)"""
+        if sample:
+            lengths = pd.DataFrame(sample, columns=columns, dtype=object).astype("string").apply(
+                lambda column: column.str.len().fillna(0).max()
+            )
+        else:
+            lengths = pd.Series(0, index=columns)
+        
+        header = pd.Series([len(str(column)) for column in columns], index=columns)
+        return [min(int(width) + 2, 50) for width in pd.concat([lengths, header], axis=1).max(axis=1)]
+    
+    @classmethod
+    def export_to_excel(
+        cls,
+        data: Iterable[Dict],
+        filename: str = None,
+        sheet_name: str = "Usuarios",
+        width_sample_rows: int = EXCEL_WIDTH_SAMPLE_ROWS
+    ) -> BytesIO:
+        """Exportar datos a Excel.
+        
+        Usa el modo write-only de openpyxl (las filas se escriben una vez y
+        no se mantiene el árbol de celdas) y calcula el ancho de las
+        columnas sobre las primeras ``width_sample_rows`` filas antes de
+        escribir, en lugar de recorrer después todas las celdas. ``data``
+        puede ser cualquier iterable, p. ej. una búsqueda paginada.
+        """
         if not filename:
             filename = f"usuarios_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
         
-        # Crear DataFrame
-        df = pd.DataFrame(data)
+        rows = iter(data)
+        sample = list(islice(rows, width_sample_rows))
+        columns = list(sample[0].keys()) if sample else []
         
-        # Formatear fechas si existen
-        date_columns = ['created_date', 'last_logon']
-        for col in date_columns:
-            if col in df.columns:
-                df[col] = pd.to_datetime(df[col], errors='coerce')
+        def values(row: Dict) -> List:
+            return [cls._excel_value(row.get(column)) for column in columns]
         
-        # Crear buffer en memoria
-        buffer = BytesIO()
+        sample = [values(row) for row in sample]
         
-        # Escribir a Excel con formato
-        with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='Usuarios', index=False)
-            
-            # Obtener el workbook y worksheet para formato
-            workbook = writer.book
-            worksheet = writer.sheets['Usuarios']
-            
-            # Ajustar ancho de columnas
-            for column in worksheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = min(max_length + 2, 50)
-                worksheet.column_dimensions[column_letter].width = adjusted_width
+        workbook = Workbook(write_only=True)
+        worksheet = workbook.create_sheet(sheet_name)
+        
+        # En write-only los anchos deben fijarse antes de la primera fila
+        for index, width in enumerate(cls._column_widths(sample, columns), start=1):
+            worksheet.column_dimensions[get_column_letter(index)].width = width
+        
+        if columns:
+            worksheet.append(columns)
         
+        for row in chain(sample, map(values, rows)):
+            worksheet.append(row)
+        
+        # Crear buffer en memoria
+        buffer = BytesIO()
+        workbook.save(buffer)
         buffer.seek(0)
         return buffer
     
@@ -56,12 +134,206 @@ class ExportService:
         return df.to_csv(index=False)
     
     @staticmethod
-    def export_to_json(data: List[Dict]) -> str:
-        """Exportar datos a JSON"""
-        # Convertir datetime a string para JSON
-        for item in data:
-            for key, value in item.items():
-                if isinstance(value, datetime):
-                    item[key] = value.isoformat()
-        
-        return json.dumps(data, indent=2, ensure_ascii=False)
\ No newline at end of file
+    def _csv_value(value):
+        if value is None:
+            return ""
+        if isinstance(value, list):
+            return "; ".join(str(v) for v in value)
+        return value
+    
+    @classmethod
+    def stream_csv(
+        cls,
+        rows: Iterable[Dict],
+        columns: Optional[List[str]] = None,
+        chunk_rows: int = STREAM_CHUNK_ROWS
+    ) -> Iterator[bytes]:
+        """CSV generado fila a fila, en bloques de ``chunk_rows`` filas.
+        
+        Consume ``rows`` de forma incremental (búsqueda paginada de AD o
+        cursor de base de datos), así que la memoria no depende del número
+        de filas. Las columnas salen de ``columns`` o de la primera fila.
+        """
+        buffer = StringIO()
+        writer = None
+        pending = 0
+        
+        for row in rows:
+            if writer is None:
+                writer = csv.DictWriter(buffer, fieldnames=columns or list(row.keys()), extrasaction="ignore")
+                writer.writeheader()
+            
+            writer.writerow({key: cls._csv_value(value) for key, value in row.items()})
+            pending += 1
+            
+            if pending >= chunk_rows:
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+                pending = 0
+        
+        if writer is None and columns:
+            csv.writer(buffer).writerow(columns)
+        
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+    
+    @staticmethod
+    def _json_default(value):
+        """Codificador para lo que json no serializa (fechas, enums, Decimal...)"""
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        if isinstance(value, (set, tuple)):
+            return list(value)
+        return str(value)
+    
+    @classmethod
+    def _json_dumps(cls, value, indent: Optional[int] = None) -> str:
+        return json.dumps(value, default=cls._json_default, ensure_ascii=False, indent=indent)
+    
+    @classmethod
+    def stream_ndjson(cls, rows: Iterable[Dict], chunk_rows: int = STREAM_CHUNK_ROWS) -> Iterator[bytes]:
+        """NDJSON: un objeto JSON por línea, serializado fila a fila"""
+        lines = []
+        for row in rows:
+            lines.append(cls._json_dumps(row))
+            if len(lines) >= chunk_rows:
+                yield ("\n".join(lines) + "\n").encode("utf-8")
+                lines = []
+        
+        if lines:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+    
+    @classmethod
+    def stream_json_array(cls, rows: Iterable[Dict], chunk_rows: int = STREAM_CHUNK_ROWS) -> Iterator[bytes]:
+        """Array JSON generado fila a fila: el primer bloque sale sin
+        esperar al resto y la memoria no depende del número de filas"""
+        parts = ["["]
+        first = True
+        for row in rows:
+            parts.append(("" if first else ",") + cls._json_dumps(row))
+            first = False
+            if len(parts) >= chunk_rows:
+                yield "".join(parts).encode("utf-8")
+                parts = []
+        
+        parts.append("]")
+        yield "".join(parts).encode("utf-8")
+    
+    @classmethod
+    def stream(cls, format: str, rows: Iterable[Dict]) -> Iterator[bytes]:
+        """Generador de bytes para uno de los ``STREAMING_FORMATS``"""
+        if format == "csv":
+            return cls.stream_csv(rows)
+        if format == "json":
+            return cls.stream_json_array(rows)
+        if format == "ndjson":
+            return cls.stream_ndjson(rows)
+        raise ValueError(f"Format '{format}' cannot be streamed")
+    
+    @classmethod
+    def export_to_json(cls, data: Iterable[Dict], indent: Optional[int] = None) -> str:
+        """Exportar datos a JSON (las fechas se codifican sin modificar ``data``)"""
+        return cls._json_dumps(list(data), indent=indent)
+    
+    @staticmethod
+    def _arrow_type(name: str):
+        types = {
+            "int": pa.int64(),
+            "float": pa.float64(),
+            "bool": pa.bool_(),
+            "string": pa.string(),
+            "date": pa.date32(),
+            "datetime": pa.timestamp("us"),
+            "datetime_utc": pa.timestamp("us", tz="UTC"),
+            "list": pa.list_(pa.string())
+        }
+        if name not in types:
+            raise ValueError(f"Unknown column type: {name}")
+        return types[name]
+    
+    @classmethod
+    def _arrow_schema(cls, columns: Optional[Dict[str, str]], first_batch: List[Dict]):
+        if columns:
+            return pa.schema([(column, cls._arrow_type(kind)) for column, kind in columns.items()])
+        
+        # Sin tipos declarados se infieren del primer lote; las columnas
+        # que solo traen nulos se guardan como texto
+        inferred = pa.Table.from_pylist(first_batch).schema
+        return pa.schema([
+            (field.name, pa.string() if pa.types.is_null(field.type) else field.type)
+            for field in inferred
+        ])
+    
+    @classmethod
+    def write_columnar(
+        cls,
+        format: str,
+        rows: Iterable[Dict],
+        sink: BinaryIO,
+        columns: Optional[Dict[str, str]] = None,
+        batch_rows: int = COLUMNAR_BATCH_ROWS
+    ) -> int:
+        """Escribir ``rows`` en Parquet o Arrow IPC (formato fichero) en ``sink``.
+        
+        Las filas se consumen por lotes de ``batch_rows``: cada lote se
+        convierte en un RecordBatch y se escribe antes de leer el siguiente,
+        así que la memoria depende del tamaño del lote y no del total.
+        ``columns`` (nombre -> tipo, ver ``export_sources``) fija el esquema;
+        si no se indica se infiere del primer lote. Devuelve las filas escritas.
+        """
+        if not ARROW_AVAILABLE:
+            raise RuntimeError("pyarrow is not installed")
+        if format not in COLUMNAR_FORMATS:
+            raise ValueError(f"Format '{format}' is not a columnar format")
+        
+        rows = iter(rows)
+        batch = list(islice(rows, batch_rows))
+        schema = cls._arrow_schema(columns, batch)
+        
+        if format == "parquet":
+            writer = pq.ParquetWriter(sink, schema, compression="snappy")
+        else:
+            writer = pa.ipc.new_file(sink, schema)
+        
+        written = 0
+        with writer:
+            # El primer lote se escribe aunque esté vacío: el fichero lleva el esquema
+            while True:
+                writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=schema))
+                written += len(batch)
+                batch = list(islice(rows, batch_rows))
+                if not batch:
+                    break
+        
+        return written
+    
+    @classmethod
+    def export_columnar(
+        cls,
+        format: str,
+        rows: Iterable[Dict],
+        columns: Optional[Dict[str, str]] = None
+    ) -> BinaryIO:
+        """Parquet/Arrow en un fichero temporal (en disco a partir de
+        ``COLUMNAR_SPOOL_BYTES``), posicionado al principio"""
+        sink = tempfile.SpooledTemporaryFile(max_size=COLUMNAR_SPOOL_BYTES)
+        try:
+            cls.write_columnar(format, rows, sink, columns)
+        except BaseException:
+            sink.close()
+            raise
+        sink.seek(0)
+        return sink
+    
+    @staticmethod
+    def iter_file(fileobj: BinaryIO, chunk_size: int = FILE_CHUNK_BYTES) -> Iterator[bytes]:
+        """Leer un fichero por bloques para StreamingResponse y cerrarlo al terminar"""
+        try:
+            while True:
+                chunk = fileobj.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            fileobj.close()
@@ -0,0 +1,198 @@
+# app/services/export_sources.py - Filas de exportación leídas por bloques
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import joinedload
+from typing import Dict, Iterator, Optional
+import os
+
+from models import models
+from models.database import SessionLocal
+
+# Las exportaciones usan el motor síncrono con yield_per: en PostgreSQL
+# (psycopg2) es un cursor de servidor, así que solo hay un bloque de filas
+# en memoria y el pool asíncrono de las peticiones no queda ocupado.
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 1000))
+
+# Tipo de cada columna, para los formatos con esquema (Parquet, Arrow):
+# int, float, bool, string, date, datetime (sin zona), datetime_utc, list
+LOCAL_USER_COLUMNS = {
+    "id": "int",
+    "email": "string",
+    "full_name": "string",
+    "department": "string",
+    "company": "string",
+    "created_date": "datetime"
+}
+
+ITEM_COLUMNS = {
+    "id": "int",
+    "brand": "string",
+    "model": "string",
+    "item_type": "string",
+    "serial_number": "string",
+    "purchase_date": "date",
+    "warranty_end_date": "date",
+    "supplier": "string",
+    "location": "string",
+    "company": "string",
+    "created_at": "datetime"
+}
+
+ASSIGNMENT_COLUMNS = {
+    "id": "int",
+    "item_id": "int",
+    "item_serial_number": "string",
+    "item_brand": "string",
+    "item_model": "string",
+    "item_type": "string",
+    "user_id": "int",
+    "user_email": "string",
+    "user_full_name": "string",
+    "assigned_date": "datetime",
+    "returned_date": "datetime",
+    "notes": "string"
+}
+
+# ldap3 devuelve whenCreated/lastLogon con zona horaria (UTC)
+AD_USER_COLUMNS = {
+    "username": "string",
+    "display_name": "string",
+    "first_name": "string",
+    "last_name": "string",
+    "email": "string",
+    "department": "string",
+    "title": "string",
+    "phone": "string",
+    "mobile": "string",
+    "office": "string",
+    "company": "string",
+    "manager": "string",
+    "employee_id": "string",
+    "created_date": "datetime_utc",
+    "last_logon": "datetime_utc",
+    "dn": "string"
+}
+
+
+def ad_user_columns(include_groups: bool = False) -> Dict[str, str]:
+    if include_groups:
+        return {**AD_USER_COLUMNS, "groups": "list"}
+    return AD_USER_COLUMNS
+
+
+def local_user_row(user: models.User) -> Dict:
+    """Fila de exportación para un usuario de la base local"""
+    department = user.department
+    return {
+        "id": user.id,
+        "email": user.email,
+        "full_name": user.full_name,
+        "department": department.name if department else None,
+        "company": department.company.name if department and department.company else None,
+        "created_date": user.created_at
+    }
+
+
+def item_row(item: models.Item) -> Dict:
+    location = item.location
+    return {
+        "id": item.id,
+        "brand": item.brand,
+        "model": item.model,
+        "item_type": item.item_type.value if item.item_type else None,
+        "serial_number": item.serial_number,
+        "purchase_date": item.purchase_date,
+        "warranty_end_date": item.warranty_end_date,
+        "supplier": item.supplier,
+        "location": location.name if location else None,
+        "company": location.company.name if location and location.company else None,
+        "created_at": item.created_at
+    }
+
+
+def assignment_row(assignment: models.Assignment) -> Dict:
+    item = assignment.item
+    user = assignment.user
+    return {
+        "id": assignment.id,
+        "item_id": assignment.item_id,
+        "item_serial_number": item.serial_number if item else None,
+        "item_brand": item.brand if item else None,
+        "item_model": item.model if item else None,
+        "item_type": item.item_type.value if item and item.item_type else None,
+        "user_id": assignment.user_id,
+        "user_email": user.email if user else None,
+        "user_full_name": user.full_name if user else None,
+        "assigned_date": assignment.assigned_date,
+        "returned_date": assignment.returned_date,
+        "notes": assignment.notes
+    }
+
+
+def _stream(query, row, chunk_size: Optional[int] = None) -> Iterator[Dict]:
+    with SessionLocal() as db:
+        result = db.scalars(query.execution_options(yield_per=chunk_size or EXPORT_CHUNK_SIZE))
+        for instance in result:
+            yield row(instance)
+
+
+def _count(query) -> int:
+    with SessionLocal() as db:
+        return db.scalar(select(func.count()).select_from(query.order_by(None).subquery()))
+
+
+def _local_users_query(search: Optional[str] = None):
+    query = select(models.User).order_by(models.User.id)
+    if search:
+        pattern = f"%{search}%"
+        query = query.where(or_(
+            models.User.full_name.ilike(pattern),
+            models.User.email.ilike(pattern)
+        ))
+    return query
+
+
+def _assignments_query(active_only: bool = False):
+    query = select(models.Assignment).order_by(models.Assignment.id)
+    if active_only:
+        query = query.where(models.Assignment.returned_date == None)
+    return query
+
+
+def iter_local_users(search: Optional[str] = None, chunk_size: Optional[int] = None) -> Iterator[Dict]:
+    query = _local_users_query(search).options(
+        joinedload(models.User.department).joinedload(models.Department.company)
+    )
+    return _stream(query, local_user_row, chunk_size)
+
+
+def count_local_users(search: Optional[str] = None) -> int:
+    return _count(_local_users_query(search))
+
+
+def iter_items(chunk_size: Optional[int] = None) -> Iterator[Dict]:
+    query = select(models.Item).options(
+        joinedload(models.Item.location).joinedload(models.Location.company)
+    ).order_by(models.Item.id)
+    return _stream(query, item_row, chunk_size)
+
+
+def count_items() -> int:
+    return _count(select(models.Item))
+
+
+def iter_assignments(active_only: bool = False, chunk_size: Optional[int] = None) -> Iterator[Dict]:
+    query = _assignments_query(active_only).options(
+        joinedload(models.Assignment.item),
+        joinedload(models.Assignment.user)
+    )
+    return _stream(query, assignment_row, chunk_size)
+
+
+def count_assignments(active_only: bool = False) -> int:
+    return _count(_assignments_query(active_only))
+
+
+def iter_ad_users(ad_service, search_term: str = "", include_groups: bool = False) -> Iterator[Dict]:
+    """Usuarios de AD página a página (Simple Paged Results)"""
+    return ad_service.paged_search_users(search_term, include_groups=include_groups)
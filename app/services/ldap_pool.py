@@ -0,0 +1,170 @@
+# app/services/ldap_pool.py - Pool de conexiones LDAP reutilizables
+
+from collections import deque
+from contextlib import contextmanager
+from ldap3 import Connection
+from ldap3.core.exceptions import LDAPException
+from typing import Callable, Deque, Dict, Optional, Tuple
+import logging
+import threading
+import time
+
+
+class LDAPPoolTimeoutError(Exception):
+    """No se pudo obtener una conexión del pool a tiempo"""
+
+
+class LDAPConnectionPool:
+    """Pool local de conexiones ldap3 ya autenticadas (bind).
+
+    Las conexiones se crean bajo demanda con ``connect`` (que debe devolver
+    una conexión ligada o lanzar una excepción), se comprueban antes de
+    reutilizarlas si llevan tiempo sin usarse y se cierran cuando superan
+    el tiempo máximo de inactividad. Una conexión que falla durante una
+    operación LDAP se descarta en lugar de volver al pool.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Connection],
+        max_size: int = 5,
+        idle_timeout: float = 300,
+        health_check_interval: float = 60,
+        acquire_timeout: float = 30,
+        logger: Optional[logging.Logger] = None
+    ):
+        self._connect = connect
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        self.logger = logger or logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._idle: Deque[Tuple[Connection, float]] = deque()
+        self._in_use = 0
+
+        # Contadores
+        self._created = 0
+        self._reused = 0
+        self._discarded = 0
+        self._reaped = 0
+
+    @contextmanager
+    def connection(self):
+        """Obtener una conexión del pool durante el bloque ``with``"""
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise LDAPPoolTimeoutError(
+                f"No LDAP connection available after {self.acquire_timeout}s"
+            )
+
+        conn = None
+        broken = False
+        try:
+            conn = self._checkout()
+            yield conn
+        except LDAPException:
+            broken = True
+            raise
+        finally:
+            if conn is not None:
+                self._checkin(conn, broken)
+            self._slots.release()
+
+    def _checkout(self) -> Connection:
+        self.reap_idle()
+
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn, last_used = self._idle.pop()
+
+            if self._is_healthy(conn, last_used):
+                with self._lock:
+                    self._reused += 1
+                    self._in_use += 1
+                return conn
+
+            self._discard(conn)
+
+        conn = self._connect()
+        with self._lock:
+            self._created += 1
+            self._in_use += 1
+        return conn
+
+    def _checkin(self, conn: Connection, broken: bool = False):
+        with self._lock:
+            self._in_use -= 1
+
+        if broken or conn.closed or not conn.bound:
+            self._discard(conn)
+            return
+
+        with self._lock:
+            self._idle.append((conn, time.monotonic()))
+
+    def _is_healthy(self, conn: Connection, last_used: float) -> bool:
+        if conn.closed or not conn.bound:
+            return False
+
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+
+        # Conexión inactiva desde hace tiempo: comprobar que sigue viva
+        try:
+            return conn.extend.standard.who_am_i() is not None
+        except LDAPException as e:
+            self.logger.info(f"Discarding stale LDAP connection: {e}")
+            return False
+
+    def _discard(self, conn: Connection):
+        with self._lock:
+            self._discarded += 1
+        try:
+            conn.unbind()
+        except Exception:
+            pass
+
+    def reap_idle(self):
+        """Cerrar las conexiones que superan el tiempo máximo de inactividad"""
+        now = time.monotonic()
+        expired = []
+
+        with self._lock:
+            # Las más antiguas están al principio de la cola
+            while self._idle and now - self._idle[0][1] > self.idle_timeout:
+                expired.append(self._idle.popleft()[0])
+            self._reaped += len(expired)
+
+        for conn in expired:
+            try:
+                conn.unbind()
+            except Exception:
+                pass
+
+    def close(self):
+        """Cerrar todas las conexiones inactivas"""
+        with self._lock:
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+
+        for conn in idle:
+            try:
+                conn.unbind()
+            except Exception:
+                pass
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "max_size": self.max_size,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "created": self._created,
+                "reused": self._reused,
+                "discarded": self._discarded,
+                "reaped": self._reaped
+            }
@@ -0,0 +1,118 @@
+# app/services/result_cache.py - Cache LRU en memoria con caducidad por entrada
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+import threading
+import time
+
+
+class TTLLRUCache:
+    """Cache acotada: descarta la entrada menos usada al llenarse y cada
+    entrada caduca ``ttl`` segundos después de guardarse.
+
+    Con ``stale_ttl`` las entradas caducadas se conservan ese tiempo extra
+    y ``get_stale`` las sigue devolviendo, para responder con datos
+    antiguos cuando el backend no está disponible.
+
+    Segura entre hilos (los routers llaman al servicio de AD desde el
+    threadpool). Con ``max_size`` o ``ttl`` a 0 la cache queda desactivada.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300, stale_ttl: float = 0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+
+        # Contadores
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._stale_hits = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl > 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return default
+
+            value, expires_at = entry
+            now = time.monotonic()
+            if now >= expires_at:
+                # Se conserva durante stale_ttl por si hay que usar get_stale
+                if now >= expires_at + self.stale_ttl:
+                    del self._entries[key]
+                self._expirations += 1
+                self._misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def get_stale(self, key: Hashable, default: Any = None) -> Any:
+        """Valor aunque haya caducado, mientras esté dentro de stale_ttl"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+
+            value, expires_at = entry
+            if time.monotonic() >= expires_at + self.stale_ttl:
+                return default
+
+            self._stale_hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, key: Hashable) -> bool:
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Eliminar las entradas cuya clave cumple ``predicate``"""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def clear(self) -> int:
+        with self._lock:
+            removed = len(self._entries)
+            self._entries.clear()
+            return removed
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "stale_ttl_seconds": self.stale_ttl,
+                "size": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 3) if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "stale_hits": self._stale_hits
+            }
@@ -0,0 +1,168 @@
+# app/services/user_import.py - Alta masiva de usuarios de AD en la tabla users
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from typing import Dict, Iterable, List, Optional
+import logging
+import os
+
+from models import models
+from models.database import SessionLocal
+from .ad_service import ActiveDirectoryService
+from .ad_sync import DIALECT_INSERTS
+
+
+class ADUserImporter:
+    """Importa usuarios de AD en ``users`` con INSERT ... ON CONFLICT (email).
+
+    Los usuarios se leen de la búsqueda paginada (o de cualquier iterable
+    con el formato de ``search_users``) y se escriben por lotes de
+    ``batch_size`` filas: una consulta para saber cuáles ya existen y un
+    único upsert por lote, en lugar de un commit por usuario.
+
+    El departamento de AD se asocia por nombre (sin distinguir mayúsculas)
+    con los ``Department`` existentes, opcionalmente solo los de una
+    empresa. Si no hay coincidencia se usa ``default_department_id`` o,
+    con ``create_departments``, se crea el departamento en esa empresa.
+    """
+
+    def __init__(
+        self,
+        ad_service: ActiveDirectoryService,
+        session_factory=SessionLocal,
+        batch_size: Optional[int] = None,
+        logger: Optional[logging.Logger] = None
+    ):
+        self.ad_service = ad_service
+        self.session_factory = session_factory
+        self.batch_size = batch_size or int(os.getenv("USER_IMPORT_BATCH_SIZE", 1000))
+        self.logger = logger or logging.getLogger(__name__)
+
+    def run(
+        self,
+        search_term: str = "",
+        company_id: Optional[int] = None,
+        create_departments: bool = False,
+        default_department_id: Optional[int] = None
+    ) -> Dict:
+        """Importar los usuarios de AD que coinciden con ``search_term``"""
+        users = self.ad_service.paged_search_users(search_term)
+        return self.import_users(users, company_id, create_departments, default_department_id)
+
+    def import_users(
+        self,
+        users: Iterable[Dict],
+        company_id: Optional[int] = None,
+        create_departments: bool = False,
+        default_department_id: Optional[int] = None
+    ) -> Dict:
+        if create_departments and company_id is None:
+            raise ValueError("company_id is required to create departments")
+
+        summary = {"inserted": 0, "updated": 0, "skipped": 0, "departments_created": 0}
+
+        with self.session_factory() as db:
+            departments = self._load_departments(db, company_id)
+            batch: Dict[str, Dict] = {}
+
+            for user in users:
+                email = (user.get('email') or '').strip()
+                if not email or email in batch:
+                    # Sin email no hay clave de upsert; repetidos en el lote
+                    # harían que ON CONFLICT tocara la misma fila dos veces
+                    summary["skipped"] += 1
+                    continue
+
+                department_id = self._department_id(
+                    db, departments, user.get('department'), company_id,
+                    create_departments, default_department_id, summary
+                )
+                batch[email] = {
+                    "email": email,
+                    "full_name": user.get('display_name') or user.get('username'),
+                    "department_id": department_id
+                }
+
+                if len(batch) >= self.batch_size:
+                    self._upsert(db, list(batch.values()), summary)
+                    batch = {}
+
+            if batch:
+                self._upsert(db, list(batch.values()), summary)
+
+            db.commit()
+
+        self.logger.info(f"AD user import finished: {summary}")
+        return summary
+
+    @staticmethod
+    def _load_departments(db: Session, company_id: Optional[int]) -> Dict[str, int]:
+        query = select(models.Department.id, models.Department.name).order_by(models.Department.id)
+        if company_id is not None:
+            query = query.where(models.Department.company_id == company_id)
+
+        departments: Dict[str, int] = {}
+        for department_id, name in db.execute(query):
+            if name:
+                departments.setdefault(name.strip().lower(), department_id)
+        return departments
+
+    @staticmethod
+    def _department_id(
+        db: Session,
+        departments: Dict[str, int],
+        name: Optional[str],
+        company_id: Optional[int],
+        create_departments: bool,
+        default_department_id: Optional[int],
+        summary: Dict
+    ) -> Optional[int]:
+        name = (name or '').strip()
+        if not name:
+            return default_department_id
+
+        department_id = departments.get(name.lower())
+        if department_id is not None:
+            return department_id
+
+        if not create_departments:
+            return default_department_id
+
+        department = models.Department(name=name, company_id=company_id)
+        db.add(department)
+        db.flush()
+        departments[name.lower()] = department.id
+        summary["departments_created"] += 1
+        return department.id
+
+    def _upsert(self, db: Session, rows: List[Dict], summary: Dict):
+        dialect = db.get_bind().dialect.name
+        insert = DIALECT_INSERTS.get(dialect)
+        if insert is None:
+            raise ValueError(f"User import does not support the '{dialect}' dialect")
+
+        emails = [row["email"] for row in rows]
+        existing = db.scalar(
+            select(func.count()).select_from(models.User).where(models.User.email.in_(emails))
+        )
+
+        statement = insert(models.User).values(rows)
+        db.execute(statement.on_conflict_do_update(
+            index_elements=['email'],
+            set_={
+                "full_name": statement.excluded.full_name,
+                # Sin departamento en AD se conserva el que ya tenía
+                "department_id": func.coalesce(statement.excluded.department_id, models.User.department_id)
+            }
+        ))
+
+        summary["updated"] += existing
+        summary["inserted"] += len(rows) - existing
+
+
+if __name__ == "__main__":
+    # python -m services.user_import [término]  (desde el directorio app/)
+    import sys
+
+    importer = ADUserImporter(ActiveDirectoryService())
+    print(importer.run(search_term=" ".join(sys.argv[1:])))
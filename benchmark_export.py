@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# benchmark_export.py - Comparar la exportación a Excel anterior con la actual
+#
+# Uso: python benchmark_export.py [--memoria] [filas ...]   (por defecto 10000 y 100000)
+#
+# Con --memoria se repite cada exportación con tracemalloc para medir el
+# pico de memoria (mucho más lento).
+
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from io import BytesIO
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "app"))
+
+from services.export_service import ExportService
+
+
+def legacy_export_to_excel(data):
+    """Implementación anterior: pandas + openpyxl normal y ancho celda a celda"""
+    df = pd.DataFrame(data)
+    for col in ['created_date', 'last_logon']:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+
+    buffer = BytesIO()
+    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+        df.to_excel(writer, sheet_name='Usuarios', index=False)
+        worksheet = writer.sheets['Usuarios']
+        for column in worksheet.columns:
+            max_length = 0
+            column_letter = column[0].column_letter
+            for cell in column:
+                try:
+                    if len(str(cell.value)) > max_length:
+                        max_length = len(str(cell.value))
+                except:
+                    pass
+            worksheet.column_dimensions[column_letter].width = min(max_length + 2, 50)
+    buffer.seek(0)
+    return buffer
+
+
+def sample_rows(count):
+    """Filas con la forma de un usuario de AD (sin zona horaria, como admite la versión anterior)"""
+    base_date = datetime(2020, 1, 1)
+    for i in range(count):
+        yield {
+            'username': f"user{i:06d}",
+            'display_name': f"Usuario de Prueba {i}",
+            'first_name': f"Nombre{i}",
+            'last_name': f"Apellido{i % 500}",
+            'email': f"user{i:06d}@example.com",
+            'department': ["IT", "RRHH", "Finanzas", "Logística"][i % 4],
+            'title': "Técnico" if i % 3 else "Responsable de área",
+            'phone': f"+34 971 {i % 1000000:06d}",
+            'office': f"Oficina {i % 40}",
+            'company': "Empresa",
+            'employee_id': str(100000 + i),
+            'created_date': base_date + timedelta(hours=i),
+            'last_logon': base_date + timedelta(days=i % 365),
+            'dn': f"CN=Usuario {i},OU=Users,DC=example,DC=com"
+        }
+
+
+def measure(label, func, make_rows, with_memory=False):
+    rows = make_rows()
+    started = time.perf_counter()
+    buffer = func(rows)
+    elapsed = time.perf_counter() - started
+    line = f"  {label:<10} {elapsed:8.2f} s   fichero {len(buffer.getvalue()) / 1024 / 1024:6.1f} MB"
+
+    if with_memory:
+        # Pasada aparte: tracemalloc distorsiona el tiempo
+        rows = make_rows()
+        tracemalloc.start()
+        func(rows)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        line += f"   pico {peak / 1024 / 1024:8.1f} MB"
+
+    print(line, flush=True)
+    return elapsed
+
+
+def main():
+    with_memory = "--memoria" in sys.argv[1:]
+    sizes = [int(arg) for arg in sys.argv[1:] if arg != "--memoria"] or [10000, 100000]
+
+    for count in sizes:
+        print(f"📊 {count} filas", flush=True)
+        legacy = measure("anterior", legacy_export_to_excel, lambda: list(sample_rows(count)), with_memory)
+        # La versión actual acepta un generador: no necesita la lista completa
+        current = measure("actual", ExportService.export_to_excel, lambda: sample_rows(count), with_memory)
+        print(f"  ➜ {legacy / current:.1f}x más rápido")
+
+
+if __name__ == "__main__":
+    main()
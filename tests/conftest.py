@@ -0,0 +1,64 @@
+# tests/conftest.py - Aplicación contra una base SQLite temporal
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+
+# La URL se lee al importar models.database: hay que fijarla antes
+_db_file = tempfile.NamedTemporaryFile(prefix="inventario_test_", suffix=".db", delete=False)
+_db_file.close()
+os.environ["DATABASE_URL"] = f"sqlite:///{_db_file.name}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+
+# La aplicación se ejecuta desde app/ (imports y rutas de plantillas)
+sys.path.insert(0, APP_DIR)
+os.chdir(APP_DIR)
+
+
+@pytest.fixture(scope="session")
+def app():
+    import main
+    yield main.app
+    os.unlink(_db_file.name)
+
+
+@pytest.fixture(scope="session")
+def client(app):
+    from fastapi.testclient import TestClient
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def db(app):
+    from models.database import SessionLocal
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def count_queries(app):
+    """Contar las sentencias SQL que ejecuta una petición"""
+    from sqlalchemy import event
+    from models.database import async_engine
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+    def count(client, url: str) -> int:
+        statements.clear()
+        response = client.get(url)
+        assert response.status_code == 200, response.text[-500:]
+        return len(statements)
+
+    yield count
+    event.remove(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
@@ -0,0 +1,96 @@
+# tests/test_list_queries.py - Número de consultas de las páginas de listado (N+1)
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import models
+
+# Consultas de cada página, tenga las filas que tenga: las relaciones que
+# pinta la plantilla se cargan con joinedload/selectinload en crud, no de
+# forma perezosa fila a fila.
+LIST_PAGE_QUERIES = {
+    "/items/": 1,
+    "/assignments/": 1,
+    "/assignments/history": 1,
+    "/companies/": 1,
+    "/users/?source=local": 1,
+}
+
+# Ficha de un ítem: ítem con sede y empresa (join) y sus asignaciones con
+# el usuario de cada una (selectinload)
+ITEM_DETAIL_QUERIES = 2
+
+
+def add_rows(db, count: int, prefix: str):
+    """Empresa con sedes, departamentos, usuarios, ítems y asignaciones"""
+    company = models.Company(name=f"{prefix} company")
+    db.add(company)
+    db.flush()
+
+    location = models.Location(name=f"{prefix} HQ", address="-", company_id=company.id)
+    department = models.Department(name=f"{prefix} IT", company_id=company.id)
+    db.add_all([location, department])
+    db.flush()
+
+    for i in range(count):
+        user = models.User(
+            email=f"{prefix}{i}@example.com",
+            full_name=f"{prefix} user {i}",
+            department_id=department.id
+        )
+        item = models.Item(
+            brand="Dell",
+            model=f"{prefix}-{i}",
+            item_type=models.ItemType.LAPTOP,
+            serial_number=f"{prefix}-SN{i}",
+            location_id=location.id
+        )
+        db.add_all([user, item])
+        db.flush()
+
+        # Una de cada dos asignaciones sigue abierta
+        db.add(models.Assignment(
+            item_id=item.id,
+            user_id=user.id,
+            assigned_date=datetime(2024, 1, 1) + timedelta(days=i),
+            returned_date=None if i % 2 else datetime(2024, 6, 1)
+        ))
+
+    db.commit()
+
+
+@pytest.mark.parametrize("url, expected", LIST_PAGE_QUERIES.items())
+def test_list_page_queries_do_not_grow_with_rows(client, db, count_queries, url, expected):
+    prefix = url.strip("/").replace("/", "-")
+
+    add_rows(db, 3, f"small-{prefix}")
+    assert count_queries(client, url) == expected
+
+    add_rows(db, 30, f"large-{prefix}")
+    assert count_queries(client, url) == expected
+
+
+def add_item_history(db, count: int) -> int:
+    """Ítem con ``count`` asignaciones, cada una a un usuario distinto"""
+    add_rows(db, 1, f"detail-{count}")
+    item = db.query(models.Item).filter_by(serial_number=f"detail-{count}-SN0").one()
+
+    for i in range(1, count):
+        user = models.User(email=f"detail-{count}-{i}@example.com", full_name=f"detail user {i}")
+        db.add(user)
+        db.flush()
+        db.add(models.Assignment(
+            item_id=item.id,
+            user_id=user.id,
+            assigned_date=datetime(2023, 1, 1) + timedelta(days=i),
+            returned_date=datetime(2023, 1, 2) + timedelta(days=i)
+        ))
+
+    db.commit()
+    return item.id
+
+
+def test_item_detail_queries_do_not_grow_with_assignments(client, db, count_queries):
+    assert count_queries(client, f"/items/{add_item_history(db, 3)}") == ITEM_DETAIL_QUERIES
+    assert count_queries(client, f"/items/{add_item_history(db, 30)}") == ITEM_DETAIL_QUERIES